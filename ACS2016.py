@@ -1,6 +1,49 @@
+import collections
+import codecs
+import concurrent.futures
+import contextlib
+import gzip
+import hashlib
+import importlib
 import json
-import pandas as pd
-import urllib.request as urlreq
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within a process only
+    fcntl = None
+
+
+class _LazyModule:
+    """
+    Stand-in for a module, imported when one of its attributes is first
+    read. It then replaces itself in this module's globals.
+
+    numpy and pandas take about half a second to import. Render workers are
+    short-lived, and some (migrate_params(), say) never need them.
+    """
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+
+np = _LazyModule('numpy', 'np')
+pd = _LazyModule('pandas', 'pd')
+pa = _LazyModule('pyarrow', 'pa')  # optional: only render_arrow() uses it
 
 
 API_URL = 'https://api.censusreporter.org/1.0/data/show/{release}?table_ids={table_ids}&geo_ids={geoids}'
@@ -38,10 +81,930 @@ STATE_FIPS = {'al': '01', 'ak': '02', 'az': '04', 'ar': '05', 'ca': '06',
               'vt': '50', 'va': '51', 'wa': '53', 'wv': '54', 'wi': '55',
               'wy': '56', 'as': '60', 'gu': '66', 'mp': '69', 'pr': '72',
               'vi': '78'}
+# Containment queries behind render()'s 'sumlevel' menu. State sumlevels
+# take a FIPS code suffix.
+ALL_STATES_GEO = '040%7C01000US'
+SUMLEVEL_GEO_PREFIXES = {
+    'counties': '050%7C04000US',
+    'places': '160%7C04000US',
+    'metro_areas': '310%7C04000US',
+}
+# Longest URL we'll send, and most geo_ids per request. Longer lists are
+# split across requests and the responses merged.
+URL_MAX_LENGTH = 4000
+MAX_GEOIDS_PER_REQUEST = 1000
+# Most API requests in flight at once, for fan-out across states.
+MAX_CONCURRENT_REQUESTS = 8
+# Bytes of response body decoded at a time.
+READ_CHUNK_SIZE = 64 * 1024
+# Seconds to wait for a connection or for each read from it, and for all
+# attempts at one request together. Failed attempts are retried up to
+# MAX_RETRIES times, after a random delay of up to RETRY_BACKOFF seconds,
+# doubling each time.
+REQUEST_TIMEOUT = float(os.environ.get('ACS2016_REQUEST_TIMEOUT', 30))
+REQUEST_DEADLINE = float(os.environ.get('ACS2016_REQUEST_DEADLINE', 120))
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+# After this many failed attempts in a row, requests fail fast for
+# CIRCUIT_RESET_SECONDS; then one is let through to test the API.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
 
 
-# Modified from https://github.com/censusreporter/census-pandas/blob/master/util.py
-def get_data(tables=None, geoids=None, release='latest'):
+# Instrumentation: when a callback is set with set_instrumentation(), each
+# pipeline stage (connect, request, parse, curate, ...) calls it with one
+# event dict: {'stage': name, 'seconds': wall time, ...counters}. Cache and
+# snapshot lookups report zero-duration 'cache'/'snapshot' events with a
+# 'hit' flag. With no callback set, a stage costs one global lookup.
+_instrumentation = None
+
+
+def set_instrumentation(callback):
+    """
+    Send pipeline events to `callback` (None turns instrumentation off).
+
+    The callback is process-wide and is called from fetch worker threads too,
+    so it must be thread-safe. Returns the previous callback.
+    """
+    global _instrumentation
+    previous = _instrumentation
+    _instrumentation = callback
+    return previous
+
+
+@contextlib.contextmanager
+def instrumented(callback):
+    """Send pipeline events to `callback` inside a `with` block."""
+    previous = set_instrumentation(callback)
+    try:
+        yield
+    finally:
+        set_instrumentation(previous)
+
+
+_instrumentation_logger = logging.getLogger('ACS2016.instrumentation')
+
+
+def log_instrumentation(event):
+    """Instrumentation callback that logs each event as one line of JSON."""
+    _instrumentation_logger.info(json.dumps(event, sort_keys=True))
+
+
+class _Stage:
+    """Time one pipeline stage and report it when the `with` block exits."""
+    __slots__ = ('event', 'start')
+
+    def __init__(self, name, fields):
+        self.event = dict(fields, stage=name)
+
+    def set(self, key, value):
+        self.event[key] = value
+
+    def count(self, key, n=1):
+        self.event[key] = self.event.get(key, 0) + n
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.event['seconds'] = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.event['error'] = exc_type.__name__
+        callback = _instrumentation
+        if callback is not None:
+            callback(self.event)
+        return False
+
+
+class _NullStage:
+    """What _stage() returns when instrumentation is off: does nothing."""
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def count(self, key, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _stage(name, **fields):
+    if _instrumentation is None:
+        return _NULL_STAGE
+    return _Stage(name, fields)
+
+
+def _emit(name, **fields):
+    callback = _instrumentation
+    if callback is not None:
+        callback(dict(fields, stage=name))
+
+
+class _CountingReader:
+    """
+    Binary file wrapper that counts bytes read, and time spent reading,
+    into a stage.
+    """
+    def __init__(self, stream, stage):
+        self.stream = stream
+        self.stage = stage
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.stream.read() if size < 0 else self.stream.read(size)
+        self.stage.count('read_seconds', time.perf_counter() - start)
+        self.stage.count('bytes', len(data))
+        return data
+
+
+# On-disk response cache. Entries are gzipped API response bodies named by a
+# hash of (release, table_ids, geo_ids), so the same request always maps to
+# the same file. Set CACHE_DIR to None to disable caching.
+CACHE_DIR = os.environ.get('ACS2016_CACHE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'ACS2016-cache'))
+CACHE_MAX_BYTES = int(os.environ.get('ACS2016_CACHE_MAX_BYTES',
+                                     256 * 1024 * 1024))
+# Seconds after which an untouched temporary file in CACHE_DIR is taken to
+# be left over from a killed process, and deleted.
+CACHE_TMP_MAX_AGE = 3600
+# Seconds before a cached response is refetched, by release. 'latest' moves
+# when Census Reporter publishes a new release (about once a year); named
+# releases such as 'acs2016_5yr' never change, so they never expire.
+CACHE_TTL = {
+    'latest': 7 * 24 * 3600,
+}
+CACHE_DEFAULT_TTL = None
+# When true, get_data() serves only from the cache (expired entries
+# included) and never touches the network.
+OFFLINE = os.environ.get('ACS2016_OFFLINE', '') not in ('', '0')
+
+
+def _cache_key(tables, geoids, release):
+    """
+    Hash a request so equivalent requests share one cache entry.
+
+    Table ids are case-insensitive and neither list's order matters to the
+    API, so both are normalized before hashing.
+    """
+    normalized = [
+        release,
+        sorted(t.upper() for t in tables),
+        sorted(urllib.parse.unquote(g) for g in geoids),
+    ]
+    return hashlib.sha256(json.dumps(normalized).encode('utf-8')).hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, key + '.json.gz')
+
+
+def _validators_path(key):
+    return os.path.join(CACHE_DIR, key + '.validators.json')
+
+
+def _cache_open(key, release, allow_stale=False):
+    """
+    Return the cached response body for `key` as a binary file, or None.
+
+    An entry's mtime is when it was fetched (or last revalidated), for TTLs.
+    Its atime is when it was last used, which is what _evict_cache() uses
+    as its least-recently-used order; a hit bumps it.
+    """
+    if CACHE_DIR is None:
+        return None
+    path = _cache_path(key)
+    try:
+        mtime = os.path.getmtime(path)
+        ttl = CACHE_TTL.get(release, CACHE_DEFAULT_TTL)
+        if not allow_stale and ttl is not None and time.time() - mtime > ttl:
+            return None
+        f = gzip.open(path, 'rb')
+        os.utime(path, (time.time(), mtime))
+    except OSError:
+        return None
+    return f
+
+
+def _cache_validators(key):
+    """
+    Return the ETag/Last-Modified headers saved with `key`'s cache entry,
+    as {'etag': ..., 'last_modified': ...}; {} if there is no entry.
+    """
+    if CACHE_DIR is None or not os.path.exists(_cache_path(key)):
+        return {}
+    try:
+        with open(_validators_path(key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _cache_revalidated(key):
+    """Restart `key`'s TTL: the server says it hasn't changed."""
+    try:
+        os.utime(_cache_path(key))
+    except OSError:
+        pass
+
+
+# release => {'id': the release id a response named, 'checked': when it was
+# fetched}, such as {'latest': {'id': 'acs2017_5yr', ...}}. Kept in
+# CACHE_DIR/releases.json (or here, without a cache) so short-lived
+# processes share it; _rollup_arrays() uses it to spot an old rollup.
+_releases = {}
+_releases_lock = threading.Lock()
+
+
+def _known_releases():
+    if CACHE_DIR is None:
+        return _releases
+    try:
+        with open(os.path.join(CACHE_DIR, 'releases.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _note_release(release, release_id, checked):
+    """Record that a response fetched at `checked` named `release_id`."""
+    with _releases_lock:
+        releases = dict(_known_releases())
+        known = releases.get(release)
+        if known is not None and known['checked'] >= checked:
+            return
+        releases[release] = {'id': release_id, 'checked': checked}
+        if CACHE_DIR is None:
+            _releases.update(releases)
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(releases, f)
+            os.replace(tmp_path, os.path.join(CACHE_DIR, 'releases.json'))
+        except OSError:
+            pass
+
+
+class _CacheWriter:
+    """
+    Compress a response body into the cache as it streams past.
+
+    With `compressed=True` the body is already gzipped (Content-Encoding:
+    gzip) and is stored as-is. `validators` are the response's ETag and
+    Last-Modified, saved for revalidating the entry once it expires.
+
+    Nothing is visible in the cache until commit(): the body goes to a temp
+    file that is renamed into place, so concurrent readers never see a
+    partial entry. Disk errors disable the writer rather than failing the
+    fetch.
+    """
+    def __init__(self, key, validators=None, compressed=False):
+        self.key = key
+        self.validators = validators
+        self.tmp_path = None
+        self.raw_file = None
+        self.file = None
+        if CACHE_DIR is None:
+            return
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            self.raw_file = os.fdopen(fd, 'wb')
+            if compressed:
+                self.file = self.raw_file
+            else:
+                self.file = gzip.GzipFile(fileobj=self.raw_file, mode='wb')
+        except OSError:
+            self.abort()
+
+    def write(self, data):
+        if self.file is not None:
+            try:
+                self.file.write(data)
+            except OSError:
+                self.abort()
+
+    def commit(self):
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+            self.raw_file.close()
+            # Body first: dying between the two leaves the new body with the
+            # old validators, which costs one full refetch. The other way
+            # round, a 304 would keep the old body forever.
+            os.replace(self.tmp_path, _cache_path(self.key))
+            if self.validators:
+                fd, validators_tmp_path = tempfile.mkstemp(dir=CACHE_DIR,
+                                                           suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.validators, f)
+                os.replace(validators_tmp_path, _validators_path(self.key))
+            elif os.path.exists(_validators_path(self.key)):
+                os.unlink(_validators_path(self.key))
+            _evict_cache()
+        except OSError:
+            self.abort()
+
+    def abort(self):
+        for f in (self.file, self.raw_file):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self.file = self.raw_file = None
+        if self.tmp_path is not None:
+            try:
+                os.unlink(self.tmp_path)
+            except OSError:
+                pass
+            self.tmp_path = None
+
+
+class _TeeReader:
+    """Binary file wrapper that copies every byte read into a _CacheWriter."""
+    def __init__(self, stream, writer):
+        self.stream = stream
+        self.writer = writer
+
+    def read(self, size=-1):
+        # HTTPResponse.read(-1) would wait for the keep-alive connection to
+        # close; read() stops at the end of the body.
+        data = self.stream.read() if size < 0 else self.stream.read(size)
+        self.writer.write(data)
+        return data
+
+
+class _DecompressingReader:
+    """Binary file wrapper that undoes a gzip or deflate Content-Encoding."""
+    def __init__(self, stream, encoding):
+        self.stream = stream
+        # zlib-wrapped for 'deflate', as RFC 9110 specifies; some servers
+        # send raw deflate instead, which _decompress() falls back to.
+        self.wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+        self.decompressor = zlib.decompressobj(self.wbits)
+        self.started = False
+
+    def _decompress(self, data):
+        try:
+            result = self.decompressor.decompress(data)
+        except zlib.error:
+            if self.started or self.wbits != zlib.MAX_WBITS:
+                raise
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            result = self.decompressor.decompress(data)
+        self.started = True
+        return result
+
+    def read(self, size=-1):
+        while True:
+            data = self.stream.read() if size < 0 else self.stream.read(size)
+            if not data:
+                return self.decompressor.flush()
+            result = self._decompress(data)
+            if result or size < 0:
+                return result
+
+
+def _evict_cache():
+    """
+    Delete least-recently-used entries until under CACHE_MAX_BYTES, and
+    abandoned temporary files.
+    """
+    entries = []
+    tmp_cutoff = time.time() - CACHE_TMP_MAX_AGE
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('.json.gz'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Another thread or process evicted it
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+            elif entry.name.endswith('.tmp'):
+                try:
+                    if entry.stat().st_mtime < tmp_cutoff:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        try:
+            os.unlink(path[:-len('.json.gz')] + '.validators.json')
+        except OSError:
+            pass
+
+
+# One keep-alive connection per (thread, host), so consecutive requests skip
+# the TCP and TLS handshakes.
+_connections = threading.local()
+
+
+@contextlib.contextmanager
+def _http_open(url, headers=None):
+    """
+    Yield the response to GET `url`, for reading; raise HTTPError if it
+    isn't a 200 (or a 304, for conditional requests).
+    """
+    import http.client  # here, not at the top: it's slow to import
+
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    pool = _connections.__dict__.setdefault('pool', {})
+    key = (parts.scheme, parts.netloc)
+
+    timeout = REQUEST_TIMEOUT
+    deadline = getattr(_connections, 'deadline', None)
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            raise TimeoutError('Deadline passed before GET %s' % url)
+
+    for attempt in range(2):
+        conn = pool.get(key)
+        if conn is None:
+            if parts.scheme == 'https':
+                conn = http.client.HTTPSConnection(parts.netloc,
+                                                   timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(parts.netloc,
+                                                  timeout=timeout)
+            pool[key] = conn
+            with _stage('connect', host=parts.netloc):
+                conn.connect()  # DNS, TCP and TLS
+        else:
+            conn.timeout = timeout  # for http.client's own reconnects
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+        try:
+            with _stage('request', host=parts.netloc) as stage:
+                conn.request('GET', path, headers=headers or {})
+                response = conn.getresponse()
+                stage.set('status', response.status)
+            break
+        except (http.client.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError):
+            # The server closed our idle keep-alive connection. Reconnect
+            # once; a second failure is a real error.
+            conn.close()
+            del pool[key]
+            if attempt == 1:
+                raise
+
+    try:
+        if response.status not in (200, 304):
+            response.read()
+            raise urllib.error.HTTPError(url, response.status,
+                                         response.reason, response.headers,
+                                         None)
+        if response.status == 304:
+            # No body, but http.client only marks the response done (and
+            # the connection reusable) once it's read.
+            response.read()
+        if deadline is None:
+            yield response
+        else:
+            yield _DeadlineReader(response, conn.sock, deadline)
+    finally:
+        if not response.isclosed():
+            # The caller stopped reading early, so the connection is
+            # mid-response and can't be reused.
+            conn.close()
+            pool.pop(key, None)
+
+
+class _DeadlineReader:
+    """
+    http.client response wrapper whose reads time out at `deadline` (a
+    time.monotonic() time), so a slowly trickling body can't outlast it.
+    """
+    def __init__(self, response, sock, deadline):
+        self.response = response
+        self.sock = sock
+        self.deadline = deadline
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def read(self, size=-1):
+        if size < 0:
+            return b''.join(iter(lambda: self.read(READ_CHUNK_SIZE), b''))
+        timeout = self.deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutError('Deadline passed reading the response')
+        if self.sock is not None:
+            self.sock.settimeout(min(REQUEST_TIMEOUT, timeout))
+        # read1(): one socket read, not as many as it takes to fill `size`
+        data = self.response.read1(size)
+        if self.response.length == 0:
+            self.response.read()  # unlike read1(), marks the response done
+        return data
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of requesting while the API is failing."""
+
+
+class _CircuitBreaker:
+    """
+    Count failed API attempts. After CIRCUIT_FAILURE_THRESHOLD in a row,
+    "open": make check() raise CircuitOpenError for CIRCUIT_RESET_SECONDS,
+    then let one trial request through. Any HTTP response to it closes the
+    circuit; a transient failure opens it again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def check(self):
+        """Raise CircuitOpenError, or return True if this is the trial."""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if (self.trial or time.monotonic() - self.opened_at
+                    < CIRCUIT_RESET_SECONDS):
+                raise CircuitOpenError('%d API requests failed in a row; '
+                                       'not retrying yet' % self.failures)
+            self.trial = True
+            return True
+
+    def end_trial(self):
+        """Let another trial through if this one ended without a verdict."""
+        with self.lock:
+            self.trial = False
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                self.opened_at = time.monotonic()
+
+
+_circuit = _CircuitBreaker()
+
+
+def _is_transient(err):
+    """True if retrying might fix `err`: a network error, or a 429 or 5xx."""
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code == 429 or err.code >= 500
+    if isinstance(err, CircuitOpenError):
+        return False
+    import http.client
+    return isinstance(err, (OSError, http.client.HTTPException))
+
+
+def _with_retries(fn):
+    """
+    Return fn(), retrying transient errors with jittered exponential
+    backoff while there's time before REQUEST_DEADLINE.
+
+    fn()'s HTTP requests, in this thread, time out at the deadline.
+    """
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    outer_deadline = getattr(_connections, 'deadline', None)
+    if outer_deadline is not None:
+        deadline = min(deadline, outer_deadline)
+    _connections.deadline = deadline
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return fn()
+            except Exception as err:
+                if attempt == MAX_RETRIES or not _is_transient(err):
+                    raise
+                delay = random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                _emit('retry', attempt=attempt + 1, error=repr(err))
+                time.sleep(delay)
+    finally:
+        _connections.deadline = outer_deadline
+
+
+def _chunk_geoids(tables, geoids, release):
+    """
+    Split `geoids` into lists that each fit in one request's URL and row
+    limits.
+    """
+    base_length = len(API_URL.format(table_ids=','.join(tables),
+                                     geoids='', release=release))
+    chunks = [[]]
+    length = base_length
+    for geoid in geoids:
+        chunk = chunks[-1]
+        if chunk and (length + len(geoid) + 1 > URL_MAX_LENGTH
+                      or len(chunk) >= MAX_GEOIDS_PER_REQUEST):
+            chunk = []
+            chunks.append(chunk)
+            length = base_length
+        chunk.append(geoid)
+        length += len(geoid) + 1
+    return chunks
+
+
+# One pool of MAX_CONCURRENT_REQUESTS threads for every fan-out, created on
+# first use. Its threads outlive each call, and so do their keep-alive
+# connections in _connections.
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_executor_thread = threading.local()
+
+
+def _mark_executor_thread():
+    _executor_thread.active = True
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # A forked child has the object but not the threads: start anew
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_REQUESTS,
+                thread_name_prefix='ACS2016',
+                initializer=_mark_executor_thread
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _map_concurrently(fn, items):
+    """
+    Return [fn(item) for item in items], running up to
+    MAX_CONCURRENT_REQUESTS calls at once (across all callers).
+
+    Called from within a fan-out, the calls run one after another: waiting
+    on the pool from one of its own threads could deadlock, and the outer
+    fan-out already keeps it busy.
+    """
+    if len(items) <= 1 or getattr(_executor_thread, 'active', False):
+        return [fn(item) for item in items]
+    return list(_get_executor().map(fn, items))
+
+
+# key => [threading.Lock, number of threads using it]
+_fetch_locks = {}
+_fetch_locks_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _lock_file(path):
+    """
+    Hold an exclusive flock() on `path`, and delete it on the way out.
+
+    A waiter may lock a file that its holder has just deleted; it notices
+    because `path` no longer names that file, and tries again.
+    """
+    while True:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path, 'a')
+        except OSError:
+            yield  # Read-only cache: coalesce within this process only
+            return
+        locked = False
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            locked = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            pass
+        finally:
+            if not locked:
+                f.close()
+        if locked:
+            break
+
+    with f:
+        try:
+            yield
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+@contextlib.contextmanager
+def _fetch_lock(key):
+    """
+    Hold a lock on cache key `key` across threads and, through a lock file
+    in CACHE_DIR, across processes on this host.
+
+    Without a cache there is nothing for waiters to share, so no lock.
+    """
+    if CACHE_DIR is None:
+        yield
+        return
+
+    with _fetch_locks_lock:
+        entry = _fetch_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            if fcntl is None:
+                yield
+                return
+            with _lock_file(os.path.join(CACHE_DIR, key + '.lock')):
+                yield
+    finally:
+        with _fetch_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _fetch_locks[key]
+
+
+@contextlib.contextmanager
+def _open_chunk(tables, geoids, release, offline,
+                stale_while_revalidate=False):
+    """
+    Yield the API response body for one request as a binary file.
+
+    The body comes from the cache if possible. Otherwise it streams from the
+    API and is cached once the caller has read it without error. Identical
+    concurrent requests share one download: see _fetch_lock().
+
+    With `stale_while_revalidate`, an expired cache entry is yielded as is,
+    and a background thread refreshes it.
+    """
+    key = _cache_key(tables, geoids, release)
+    cached = _cache_open(key, release, allow_stale=offline)
+    if cached is None and stale_while_revalidate and not offline:
+        cached = _cache_open(key, release, allow_stale=True)
+        if cached is not None:
+            _emit('cache', hit=True, stale=True)
+            _refresh_in_background(key, tables, geoids, release)
+            with cached:
+                yield cached
+            return
+    _emit('cache', hit=cached is not None)
+    if cached is not None:
+        with cached:
+            yield cached
+        return
+
+    if offline:
+        raise LookupError('ACS data for %s in %s (%s) is not cached and '
+                          'offline mode is on'
+                          % (','.join(tables), ','.join(geoids), release))
+
+    # Only one thread or process fetches a given request at a time; the rest
+    # wait here, then find the body it cached.
+    with _fetch_lock(key):
+        cached = _cache_open(key, release)
+        if cached is not None:
+            _emit('coalesce', hit=True)
+            with cached:
+                yield cached
+            return
+
+        trial = _circuit.check()
+        try:
+            with _download(key, tables, geoids, release) as f:
+                yield f
+        except Exception as err:
+            if _is_transient(err):
+                _circuit.failed()
+            elif isinstance(err, urllib.error.HTTPError):
+                _circuit.succeeded()  # the API answered, so it is up
+            raise
+        finally:
+            if trial:
+                _circuit.end_trial()
+
+
+@contextlib.contextmanager
+def _download(key, tables, geoids, release):
+    """
+    Yield the API response body for one request as a binary file, and cache
+    it once the caller has read it without error.
+
+    An expired cache entry's validators make the request conditional; on a
+    304, the entry is yielded instead.
+    """
+    url = API_URL.format(table_ids=','.join(tables).upper(),
+                         geoids=','.join(geoids),
+                         release=release)
+    validators = _cache_validators(key)
+    while True:
+        headers = {'Accept-Encoding': 'gzip, deflate'}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        with _http_open(url, headers) as response:
+            _circuit.succeeded()
+            if response.status == 304:
+                cached = _cache_open(key, release, allow_stale=True)
+                _emit('revalidate', modified=False, hit=cached is not None)
+                if cached is not None:
+                    _cache_revalidated(key)
+                    with cached:
+                        yield cached
+                    return
+                if not validators:
+                    raise urllib.error.HTTPError(
+                        url, 304, 'Not Modified, to an unconditional request',
+                        response.headers, None
+                    )
+                # Evicted since we checked: ask again, unconditionally
+                validators = {}
+                continue
+            if validators:
+                _emit('revalidate', modified=True)
+
+            validators = {}
+            if response.getheader('ETag'):
+                validators['etag'] = response.getheader('ETag')
+            if response.getheader('Last-Modified'):
+                validators['last_modified'] = \
+                    response.getheader('Last-Modified')
+
+            encoding = (response.getheader('Content-Encoding') or '').lower()
+            if encoding == 'gzip':
+                # Cache the gzipped bytes directly: no recompressing.
+                writer = _CacheWriter(key, validators, compressed=True)
+                reader = _DecompressingReader(_TeeReader(response, writer),
+                                              encoding)
+            elif encoding == 'deflate':
+                writer = _CacheWriter(key, validators)
+                reader = _TeeReader(_DecompressingReader(response, encoding),
+                                    writer)
+            else:
+                writer = _CacheWriter(key, validators)
+                reader = _TeeReader(response, writer)
+            try:
+                yield reader
+                while reader.read(READ_CHUNK_SIZE):
+                    pass  # cache whatever the caller didn't need
+            except BaseException:
+                writer.abort()
+                raise
+            writer.commit()
+            return
+
+
+# cache key => thread refreshing its entry
+_refreshes = {}
+_refreshes_lock = threading.Lock()
+_logger = logging.getLogger('ACS2016')
+
+
+def _refresh_in_background(key, tables, geoids, release):
+    """Start refreshing an expired cache entry, unless that's under way."""
+    def refresh():
+        try:
+            def download():
+                with _open_chunk(tables, geoids, release, False) as f:
+                    while f.read(READ_CHUNK_SIZE):
+                        pass
+            _with_retries(download)
+        except Exception:
+            _logger.warning('Background refresh of %s failed', key,
+                            exc_info=True)
+        finally:
+            with _refreshes_lock:
+                del _refreshes[key]
+
+    with _refreshes_lock:
+        if key in _refreshes:
+            return
+        # Not a daemon: a process that exits right after render() (one
+        # worker per render) waits for the refresh, which _with_retries()
+        # bounds by REQUEST_DEADLINE, instead of killing it mid-download.
+        thread = _refreshes[key] = threading.Thread(target=refresh)
+    thread.start()
+
+
+def _normalize_request(tables, geoids, offline):
     if geoids is None:
         geoids = ['040|01000US']
     elif isinstance(geoids,str):
@@ -50,13 +1013,35 @@ def get_data(tables=None, geoids=None, release='latest'):
         tables = ['B01001']
     elif isinstance(tables,str):
         tables=[tables]
+    if offline is None:
+        offline = OFFLINE
+    return tables, geoids, offline
 
-    url = API_URL.format(table_ids=','.join(tables).upper(),
-                         geoids=','.join(geoids),
-                         release=release)
 
-    with urlreq.urlopen(url.format(tables, geoids)) as response:
-        return json.loads(response.read().decode('utf-8'))
+# Modified from https://github.com/censusreporter/census-pandas/blob/master/util.py
+def get_data(tables=None, geoids=None, release='latest', offline=None,
+             stale_while_revalidate=False):
+    tables, geoids, offline = _normalize_request(tables, geoids, offline)
+
+    def decode(chunk):
+        with _open_chunk(tables, chunk, release, offline,
+                         stale_while_revalidate) as f:
+            with _stage('json_decode') as stage:
+                if _instrumentation is not None:
+                    f = _CountingReader(f, stage)
+                return json.load(f)
+
+    def fetch(chunk):
+        return _with_retries(lambda: decode(chunk))
+
+    chunks = _chunk_geoids(tables, geoids, release)
+    responses = _map_concurrently(fetch, chunks)
+
+    result = responses[0]
+    for response in responses[1:]:
+        result['data'].update(response['data'])
+        result['geography'].update(response['geography'])
+    return result
 
 
 # From https://github.com/censusreporter/census-pandas/blob/master/util.py
@@ -76,262 +1061,1449 @@ def prep_for_pandas(json_data, include_moe=False):
     return result
 
 
+class _ColumnarBuilder:
+    """
+    Accumulate a Census Reporter response's 'data' into one float array.
+
+    Rows may arrive before set_tables() supplies the column list (a streamed
+    response may list 'data' before 'tables'); they wait in a list until
+    then. The array grows geometrically when the row count isn't known in
+    advance.
+    """
+    def __init__(self, include_moe=False, n_rows=0):
+        self.include_moe = include_moe
+        self.capacity = n_rows
+        self.geoids = []
+        self.pending = []
+        self.column_ids = None
+        self.column_index = None
+        self.values = None
+        # Every geoid usually lists the same columns in the same order, so
+        # remember each (table, kind)'s column positions and reuse them
+        # while the keys match.
+        self.positions = {}
+
+    def set_tables(self, tables):
+        column_ids = []
+        for table_id in sorted(tables):
+            for column_id in tables[table_id]['columns']:
+                column_ids.append(column_id)
+                if self.include_moe:
+                    column_ids.append(column_id + '_moe')
+        column_ids.sort()  # data not returned in order
+        self.column_ids = column_ids
+        self.column_index = dict((column_id, j)
+                                 for j, column_id in enumerate(column_ids))
+        self.values = np.full((max(self.capacity, len(self.pending)),
+                               len(column_ids)), np.nan)
+
+        pending, self.pending = self.pending, []
+        for geoid, row_tables in pending:
+            self.add(geoid, row_tables)
+
+    def add(self, geoid, tables):
+        if self.column_ids is None:
+            self.pending.append((geoid, tables))
+            return
+
+        i = len(self.geoids)
+        if i == self.values.shape[0]:
+            self._resize(max(16, i * 2))
+        self.geoids.append(geoid)
+        for table, kinds in tables.items():
+            if 'estimate' in kinds:
+                self._fill(i, (table, 'estimate'), kinds['estimate'], '')
+            if self.include_moe and 'error' in kinds:
+                self._fill(i, (table, 'error'), kinds['error'], '_moe')
+
+    def _fill(self, i, key, columns, suffix):
+        keys = list(columns)
+        cached = self.positions.get(key)
+        if cached is None or cached[0] != keys:
+            js = np.array([self.column_index.get(k + suffix, -1) for k in keys],
+                          dtype=np.intp)
+            cached = self.positions[key] = (keys, js, js >= 0)
+        _, js, known = cached
+        row = np.array(list(columns.values()), dtype=float)
+        self.values[i, js[known]] = row[known]
+
+    def _resize(self, n_rows):
+        old_n_rows = self.values.shape[0]
+        # In-place realloc: rows are contiguous, so existing ones stay put.
+        self.values.resize((n_rows, self.values.shape[1]), refcheck=False)
+        self.values[old_n_rows:] = np.nan
+
+    def frame(self):
+        if self.column_ids is None:
+            self.set_tables({})
+        if len(self.geoids) != self.values.shape[0]:
+            self._resize(len(self.geoids))
+        return pd.DataFrame(self.values, index=self.geoids,
+                            columns=self.column_ids, copy=False)
+
+
+def prep_columnar(response, include_moe=False):
+    """
+    Build a DataFrame, indexed by geoid, from a Census Reporter response.
+
+    Same result as from_dict(prep_for_pandas(...)) with sorted columns, but
+    the values are written straight into one pre-sized float array: no
+    per-geoid dicts, no transpose and no reordering copy. Columns come from
+    the response's 'tables' metadata; missing values are NaN.
+    """
+    builder = _ColumnarBuilder(include_moe, len(response['data']))
+    builder.set_tables(response['tables'])
+    for geoid, tables in response['data'].items():
+        builder.add(geoid, tables)
+    return builder.frame()
+
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_DECODER = json.JSONDecoder()
+
+
+class _JSONReader:
+    """
+    Pull parser for the outer levels of a JSON document in a binary file.
+
+    Only READ_CHUNK_SIZE bytes are read at a time. The caller walks objects
+    with keys() and decodes each value it reaches with value() (or walks
+    into it with keys()), so at most one inner value is buffered at once.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Append the next chunk to the buffer; return False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(READ_CHUNK_SIZE)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, self.eof)
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character."""
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON input')
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError('Expected %r at JSON input position %d'
+                             % (char, self.pos))
+        self.pos += 1
+
+    def value(self):
+        """Decode and return the next complete JSON value."""
+        self._peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Probably truncated at the end of the buffer
+                if self._fill():
+                    continue
+                raise
+            if end == len(self.buf) and self._fill():
+                continue  # A number may go on in the next chunk
+            self.pos = end
+            return value
+
+    def keys(self):
+        """
+        Iterate over the keys of the next JSON object.
+
+        Before advancing, the caller must consume each key's value.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            end = self._peek()
+            self.pos += 1
+            if end == '}':
+                return
+            if end != ',':
+                raise ValueError('Expected "," or "}" at JSON input position '
+                                 '%d' % (self.pos - 1))
+
+
+ColumnarResponse = collections.namedtuple(
+    'ColumnarResponse', ['data', 'geography', 'tables', 'release']
+)
+
+
+def _read_columnar(stream, include_moe=False):
+    """
+    Parse a Census Reporter response body from `stream` into a
+    ColumnarResponse, whose `data` is prep_columnar()'s frame.
+
+    'data' and 'geography' are decoded one geoid at a time and 'data' goes
+    straight into the array, so the body's text and the full dict are never
+    in memory at once.
+    """
+    with _stage('parse') as stage:
+        if _instrumentation is not None:
+            # 'read_seconds' is the part of 'seconds' spent waiting on the
+            # network (or cache file).
+            stream = _CountingReader(stream, stage)
+        reader = _JSONReader(stream)
+        builder = _ColumnarBuilder(include_moe)
+        geography = {}
+        tables = {}
+        release = {}
+        for key in reader.keys():
+            if key == 'data':
+                for geoid in reader.keys():
+                    builder.add(geoid, reader.value())
+            elif key == 'geography':
+                for geoid in reader.keys():
+                    geography[geoid] = reader.value()
+            elif key == 'tables':
+                tables = reader.value()
+                builder.set_tables(tables)
+            elif key == 'release':
+                release = reader.value()
+            else:
+                reader.value()
+        frame = builder.frame()
+        stage.set('rows', frame.shape[0])
+        stage.set('columns', frame.shape[1])
+    return ColumnarResponse(frame, geography, tables, release)
+
+
+def _fetch_columnar(tables, geoids, release, include_moe, offline,
+                    stale_while_revalidate=False):
+    def read(chunk):
+        with _open_chunk(tables, chunk, release, offline,
+                         stale_while_revalidate) as f:
+            response = _read_columnar(f, include_moe)
+        if 'id' in response.release:
+            # When the response was fetched: its cache entry's mtime
+            checked = time.time()
+            if CACHE_DIR is not None:
+                try:
+                    checked = os.path.getmtime(
+                        _cache_path(_cache_key(tables, chunk, release))
+                    )
+                except OSError:
+                    pass
+            _note_release(release, response.release['id'], checked)
+        return response
+
+    def fetch(chunk):
+        return _with_retries(lambda: read(chunk))
+
+    chunks = _chunk_geoids(tables, geoids, release)
+    return _merge_columnar(_map_concurrently(fetch, chunks))
+
+
+def _merge_columnar(responses):
+    if len(responses) == 1:
+        return responses[0]
+
+    geography = {}
+    for response in responses:
+        geography.update(response.geography)
+    return ColumnarResponse(pd.concat([r.data for r in responses]),
+                            geography, responses[0].tables,
+                            responses[0].release)
+
+
+# Snapshot store: every table in TOPIC_TABLES for every geography render()
+# can ask for, ingested ahead of time so renders need no network. Each
+# table is a directory of .npy files, memory-mapped on read, with rows
+# sorted by 'containment|geoid' key (e.g., '050|04000US06|05000US06001').
+# A containment query is then a binary-search range of rows. Set
+# SNAPSHOT_DIR to use one; see ingest_snapshot().
+SNAPSHOT_DIR = os.environ.get('ACS2016_SNAPSHOT_DIR') or None
+
+# table path => (meta.json mtime, meta, arrays). Re-ingesting changes the
+# mtime, so a long-lived process replaces the entry (and its memory maps of
+# the deleted files) with the new files.
+_snapshot_tables = {}
+
+
+def _snapshot_geos():
+    """Every containment query render() can make, unquoted."""
+    geos = [urllib.parse.unquote(ALL_STATES_GEO)]
+    for geo_prefix in SUMLEVEL_GEO_PREFIXES.values():
+        for state_fips in STATE_FIPS.values():
+            geos.append(urllib.parse.unquote(geo_prefix + state_fips))
+    return geos
+
+
+def _load_snapshot_table(table_id):
+    path = os.path.join(SNAPSHOT_DIR, table_id.upper())
+    try:
+        mtime = os.path.getmtime(os.path.join(path, 'meta.json'))
+    except OSError:
+        return None
+    loaded = _snapshot_tables.get(path)
+    if loaded is None or loaded[0] != mtime:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = dict(
+            (name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+            for name in ('keys', 'geoids', 'names', 'estimates', 'errors')
+        )
+        loaded = _snapshot_tables[path] = (mtime, meta, arrays)
+    return loaded[1:]
+
+
+def _snapshot_columnar(tables, geoids, release, include_moe):
+    """
+    Answer a request from the snapshot, or return None if it can't.
+
+    Only containment queries the snapshot was built with are answered. The
+    estimate frame is a view of the memory-mapped file, not a copy.
+    """
+    loaded = [_load_snapshot_table(table_id) for table_id in sorted(tables)]
+    if not loaded or None in loaded:
+        return None
+    geos = [urllib.parse.unquote(geo) for geo in geoids]
+    for meta, _ in loaded:
+        if release not in ('latest', meta['release']):
+            return None
+        if not all(geo in meta['parents'] for geo in geos):
+            return None
+
+    responses = []
+    for geo in geos:
+        frames = []
+        for meta, arrays in loaded:
+            keys = arrays['keys']
+            start = np.searchsorted(keys, geo + '|', 'left')
+            stop = np.searchsorted(keys, geo + '|\U0010ffff', 'left')
+            index = pd.Index(arrays['geoids'][start:stop], dtype=object)
+            estimates = arrays['estimates'][start:stop]
+            columns = meta['columns']
+            if include_moe:
+                values = np.empty((stop - start, 2 * len(columns)))
+                values[:, 0::2] = estimates
+                values[:, 1::2] = arrays['errors'][start:stop]
+                columns = [c for column in columns
+                           for c in (column, column + '_moe')]
+            else:
+                values = estimates
+            frames.append(pd.DataFrame(values, index=index, columns=columns,
+                                       copy=False))
+
+        # Every table was ingested for the same geographies, so any table's
+        # rows will do for names.
+        parent_geoid, parent_name = meta['parents'][geo]
+        geography = {parent_geoid: {'name': parent_name}}
+        for geoid, name in zip(index, arrays['names'][start:stop]):
+            geography[geoid] = {'name': str(name)}
+
+        data = frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+        responses.append(ColumnarResponse(
+            data, geography,
+            dict((meta['table_id'], meta['table']) for meta, _ in loaded),
+            meta.get('release_info', {})
+        ))
+
+    return _merge_columnar(responses)
+
+
+def ingest_snapshot(snapshot_dir, tables=None, release='latest'):
+    """
+    Download `tables` (default: every table in TOPIC_TABLES) for every
+    geography render() can ask for, and write them as a snapshot.
+
+    Each table is written to a temporary directory and swapped in whole, so
+    renders reading the snapshot never see a half-written table.
+    """
+    if tables is None:
+        tables = sorted(set(TOPIC_TABLES.values()))
+    geos = _snapshot_geos()
+
+    for table_id in tables:
+        table_id = table_id.upper()
+        responses = _map_concurrently(
+            lambda geo: _fetch_columnar([table_id], [geo], release, True,
+                                        OFFLINE),
+            geos
+        )
+
+        columns = list(responses[0].tables[table_id]['columns'])
+        columns.sort()
+        moe_columns = [column + '_moe' for column in columns]
+        keys, geoids, names, estimates, errors = [], [], [], [], []
+        parents = {}
+        for geo, response in zip(geos, responses):
+            parent_geoid = next(iter(response.geography))
+            parents[geo] = [parent_geoid,
+                            response.geography[parent_geoid]['name']]
+            for geoid in response.data.index:
+                keys.append(geo + '|' + geoid)
+                geoids.append(geoid)
+                names.append(response.geography.get(geoid, {}).get('name', ''))
+            estimates.append(response.data[columns].to_numpy())
+            errors.append(response.data[moe_columns].to_numpy())
+
+        order = np.argsort(np.array(keys))
+        arrays = {
+            'keys': np.array(keys)[order],
+            'geoids': np.array(geoids)[order],
+            'names': np.array(names)[order],
+            'estimates': np.concatenate(estimates)[order],
+            'errors': np.concatenate(errors)[order],
+        }
+        meta = {
+            'table_id': table_id,
+            'table': responses[0].tables[table_id],
+            'release': release,
+            'release_info': responses[0].release,
+            'columns': columns,
+            'parents': parents,
+        }
+
+        _write_array_dir(snapshot_dir, table_id, arrays, meta)
+
+
+def _write_array_dir(parent_dir, name, arrays, meta):
+    """
+    Write `arrays` as .npy files and `meta` as meta.json into directory
+    `name` of `parent_dir`, replacing any old one whole.
+    """
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent_dir, prefix=name + '.')
+    for array_name, array in arrays.items():
+        np.save(os.path.join(tmp_path, array_name + '.npy'), array)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    path = os.path.join(parent_dir, name)
+    old_path = None
+    if os.path.exists(path):
+        old_path = tempfile.mkdtemp(dir=parent_dir, prefix=name + '.old.')
+        os.rmdir(old_path)
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+# Table metadata registry: for each (release, table), the column order,
+# indent tree and resolved column names get_dataframe(col_names=True) uses.
+# It's filled from every response's 'tables' section, memoized here and
+# persisted to CACHE_DIR as one JSON file per release, so it only has to be
+# worked out once per table.
+TableMetadata = collections.namedtuple('TableMetadata',
+                                       ['column_ids', 'names', 'parents'])
+_table_metadata = {}  # (release, table_id) => TableMetadata
+_table_metadata_loaded = set()  # releases whose registry file we've read
+_table_metadata_lock = threading.Lock()
+
+
+def _compile_table_metadata(table):
+    """
+    Resolve a table's column names and indent tree.
+
+    Nested columns are named by joining their ancestors' names (never the
+    'Total:' column), e.g., 'Male: Under 5 years'.
+    """
+    column_ids = []
+    names = {}
+    parents = {}
+    colname_prepends = []
+    ancestors = []
+    columns = table['columns']
+    for column_id in columns:
+        column_ids.append(column_id)
+        colname = columns[column_id]['name']
+        indent = columns[column_id]['indent']
+
+        # Prepend nested column names
+        if indent is not None:
+            if indent > len(colname_prepends) - 1:
+                colname_prepends += [colname]
+                ancestors += [column_id]
+            else:
+                colname_prepends = colname_prepends[:indent] + [colname]
+                ancestors = ancestors[:indent] + [column_id]
+            parents[column_id] = ancestors[-2] if len(ancestors) > 1 else None
+
+            if indent == 0:
+                names[column_id] = colname
+            else:
+                names[column_id] = " ".join(colname_prepends[1:]) # Never want to prepend "Total:"
+        else:
+            names[column_id] = colname
+            parents[column_id] = None
+    return TableMetadata(column_ids, names, parents)
+
+
+def _table_metadata_path(release):
+    return os.path.join(CACHE_DIR, 'tables-%s.json' % release)
+
+
+def _read_table_metadata_file(release):
+    """Return the persisted {table_id: table} for `release`, or {}."""
+    if CACHE_DIR is None:
+        return {}
+    path = _table_metadata_path(release)
+    try:
+        ttl = CACHE_TTL.get(release, CACHE_DEFAULT_TTL)
+        if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+            return {}
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _load_table_metadata(release):
+    """Memoize `release`'s persisted registry. Call with the lock held."""
+    if release in _table_metadata_loaded:
+        return
+    _table_metadata_loaded.add(release)
+    for table_id, table in _read_table_metadata_file(release).items():
+        _table_metadata[(release, table_id)] = _compile_table_metadata(table)
+
+
+def _register_tables(release, tables):
+    """Add a response's 'tables' section to the registry."""
+    with _table_metadata_lock:
+        _load_table_metadata(release)
+        new_tables = dict((table_id, table) for table_id, table in tables.items()
+                          if (release, table_id) not in _table_metadata)
+        if not new_tables:
+            return
+        for table_id, table in new_tables.items():
+            _table_metadata[(release, table_id)] = \
+                _compile_table_metadata(table)
+
+        if CACHE_DIR is None:
+            return
+        persisted = _read_table_metadata_file(release)
+        persisted.update(new_tables)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(persisted, f)
+            os.replace(tmp_path, _table_metadata_path(release))
+        except OSError:
+            pass  # A read-only or full disk shouldn't break the render
+
+
+def table_metadata(table_id, release='latest'):
+    """
+    Return the TableMetadata for `table_id` in `release`.
+
+    The registry answers from memory or CACHE_DIR when it can; otherwise it
+    fetches the table (for all states) to learn its metadata.
+    """
+    table_id = table_id.upper()
+    key = (release, table_id)
+    with _table_metadata_lock:
+        _load_table_metadata(release)
+        if key in _table_metadata:
+            return _table_metadata[key]
+
+    get_columnar(table_id, release=release)
+    return _table_metadata[key]
+
+
+def get_columnar(tables=None, geoids=None, release='latest',
+                 include_moe=False, offline=None,
+                 stale_while_revalidate=False):
+    """
+    Like get_data(), but return a ColumnarResponse, streaming each response
+    into its frame instead of decoding the whole body first.
+
+    If SNAPSHOT_DIR holds the request, it's answered from there instead.
+    """
+    tables, geoids, offline = _normalize_request(tables, geoids, offline)
+
+    response = None
+    if SNAPSHOT_DIR is not None:
+        response = _snapshot_columnar(tables, geoids, release, include_moe)
+        _emit('snapshot', hit=response is not None)
+    if response is None:
+        response = _fetch_columnar(tables, geoids, release, include_moe,
+                                   offline, stale_while_revalidate)
+    _register_tables(release, response.tables)
+    return response
+
+
+def _compact_values(values):
+    """
+    Split 2-D float array `values` into columns: nullable Int32 where all of
+    a column's values are whole numbers that fit, float64 otherwise.
+
+    Counts are whole numbers, so most columns become Int32: half the memory,
+    and missing values stay missing (<NA>) instead of forcing floats.
+    """
+    values = np.asfortranarray(values, dtype=float)  # contiguous columns
+    missing = np.isnan(values)
+    whole = np.where(missing, 0.0, values)
+    fits = ((whole == np.trunc(whole))
+            & (np.abs(whole) < 2 ** 31)).all(axis=0)
+    # Only the columns that fit: casting the others warns
+    ints = dict(zip(np.flatnonzero(fits),
+                    whole[:, fits].astype(np.int32, order='F').T))
+    return [
+        pd.arrays.IntegerArray(ints[j], missing[:, j]) if fits[j]
+        else values[:, j]
+        for j in range(values.shape[1])
+    ]
+
+
+def _compact_text(values):
+    """
+    Return strings `values` as Arrow-backed strings (one buffer, no Python
+    objects) if pyarrow is installed; otherwise as a Categorical, which
+    keeps one copy of each distinct string.
+    """
+    try:
+        return pd.array(values, dtype='string[pyarrow]')
+    except ImportError:
+        return pd.Categorical(values)
+
+
+def _compact_frame(frame):
+    """
+    Convert a curated frame ('name', 'geoid', then floats) to compact
+    dtypes: see _compact_values() and _compact_text().
+    """
+    columns = {'name': _compact_text(frame['name']),
+               'geoid': _compact_text(frame['geoid'])}
+    columns.update(zip(frame.columns[2:],
+                       _compact_values(frame.iloc[:, 2:].to_numpy())))
+    return pd.DataFrame(columns, copy=False)
+
+
 # Modified from https://github.com/censusreporter/census-pandas/blob/master/util.py
-def get_dataframe(tables=None, geoids=None, release='latest',geo_names=False,col_names=False,include_moe=False):
-    response = get_data(tables=tables,geoids=geoids,release=release)
-    frame = pd.DataFrame.from_dict(prep_for_pandas(response['data'],include_moe),orient='index')
-    frame = frame[sorted(frame.columns.values)] # data not returned in order
+def get_dataframe(tables=None, geoids=None, release='latest',geo_names=False,col_names=False,include_moe=False,compact=False):
+    """
+    With `compact`, counts are nullable Int32 and 'name' and 'geoid' are
+    compact strings (see _compact_values() and _compact_text()), and the
+    frame is built in one go instead of by inserting columns into the
+    response's frame.
+    """
+    response = get_columnar(tables=tables,geoids=geoids,release=release,include_moe=include_moe)
+    if compact:
+        return _compact_response_frame(response, release, geo_names,
+                                       col_names)
+    frame = response.data
     if geo_names:
-        geo = pd.DataFrame.from_dict(response['geography'],orient='index')
+        geo = pd.DataFrame.from_dict(response.geography,orient='index')
         frame.insert(0,'name',geo['name'])
     if col_names:
         d = {}
-        for table_id in response['tables']:
-            colname_prepends = []
-            columns = response['tables'][table_id]['columns']
-            for column_id in columns:
-                colname = columns[column_id]['name']
-                indent = columns[column_id]['indent']
-
-                # Prepend nested column names
-                if indent is not None:
-                    if indent > len(colname_prepends) - 1:
-                        colname_prepends += [colname]
-                    else:
-                        colname_prepends = colname_prepends[:indent] + [colname]
-
-                    if indent == 0:
-                        d[column_id] = colname
-                    else:
-                        d[column_id] = " ".join(colname_prepends[1:]) # Never want to prepend "Total:"
-                else:
-                    d[column_id] = colname
-
+        for table_id in response.tables:
+            d.update(table_metadata(table_id, release).names)
         frame = frame.rename(columns=d)
 
     # Add geoid column
-    parsed_geoids = sorted(response['geography'].keys())[1:] # First one is parent
+    parsed_geoids = sorted(response.geography.keys())[1:] # First one is parent
     frame.insert(1, 'geoid', parsed_geoids)
 
     return frame
 
 
-def get_dataframe_simple(topic, geo):
-    topic_table = TOPIC_TABLES[topic]
-    response = get_data(tables=topic_table, geoids=geo, release='latest')
-    data = pd.DataFrame.from_dict(prep_for_pandas(response['data'], False), orient='index')
-    data = data[sorted(data.columns.values)] # data not returned in order
+def _compact_response_frame(response, release, geo_names, col_names):
+    """get_dataframe(..., compact=True): same columns, compact dtypes."""
+    frame = response.data
+    labels = list(frame.columns)
+    if col_names:
+        d = {}
+        for table_id in response.tables:
+            d.update(table_metadata(table_id, release).names)
+        labels = [d.get(label, label) for label in labels]
+    items = list(zip(labels, _compact_values(frame.to_numpy())))
+    if geo_names:
+        items.insert(0, ('name', _compact_text([
+            response.geography.get(geoid, {}).get('name')
+            for geoid in frame.index
+        ])))
+    # Where get_dataframe() inserts it
+    parsed_geoids = sorted(response.geography.keys())[1:]
+    items.insert(1, ('geoid', _compact_text(parsed_geoids)))
+    return pd.DataFrame(dict(items), index=frame.index, copy=False)
 
-    # geo is indexed by geoid
-    geo = pd.DataFrame.from_dict(response['geography'], orient='index')
-    curated_data = pd.DataFrame.from_dict(geo['name'].iloc[1:])
 
-    # Add geoid column
-    parsed_geoids = sorted(response['geography'].keys())[1:] # First one is parent
-    curated_data.insert(1, 'geoid', parsed_geoids)
-
-    # Column curation
-    if topic == 'age':
-        under_18 = data['B01001003'] + data['B01001004'] + data['B01001005'] + \
-            data['B01001006'] + data['B01001027'] + data['B01001028'] + \
-            data['B01001029'] + data['B01001030']
-        curated_data.insert(2, 'Under 18', under_18)
-
-        eighteen_to_64 = data['B01001007'] + data['B01001008'] + \
-            data['B01001009'] + data['B01001010'] + data['B01001011'] + \
-            data['B01001012'] + data['B01001013'] + data['B01001014'] + \
-            data['B01001015'] + data['B01001016'] + data['B01001017'] + \
-            data['B01001018'] + data['B01001019'] + data['B01001031'] + \
-            data['B01001032'] + data['B01001033'] + data['B01001034'] + \
-            data['B01001035'] + data['B01001036'] + data['B01001037'] + \
-            data['B01001038'] + data['B01001039'] + data['B01001040'] + \
-            data['B01001041'] + data['B01001042'] + data['B01001043']
-        curated_data.insert(3, '18 to 64', eighteen_to_64)
-
-        over_65 = data['B01001020'] + data['B01001021'] + \
-            data['B01001022'] + data['B01001023'] + data['B01001024'] + \
-            data['B01001025'] + data['B01001044'] + data['B01001045'] + \
-            data['B01001046'] + data['B01001047'] + data['B01001048'] + \
-            data['B01001049']
-        curated_data.insert(4, 'Over 65', over_65)
-
-    elif topic == 'sex':
-        curated_data.insert(2, 'Male', data['B01001002'])
-        curated_data.insert(3, 'Female', data['B01001026'])
-
-    elif topic == 'race':
-        curated_data.insert(2, 'White', data['B03002003'])
-        curated_data.insert(3, 'Black', data['B03002004'])
-        curated_data.insert(4, 'Native', data['B03002005'])
-        curated_data.insert(5, 'Asian', data['B03002006'])
-        curated_data.insert(5, 'Islander', data['B03002007'])
-        curated_data.insert(5, 'Other', data['B03002008'])
-        curated_data.insert(5, 'Two or More', data['B03002009'])
-        curated_data.insert(6, 'Hispanic', data['B03002012'])
-
-    elif topic == 'household_income':
-        under_50k = data['B19001002'] + data['B19001003'] + \
-            data['B19001004'] + data['B19001005'] + data['B19001006'] + \
-            data['B19001007'] + data['B19001008'] + data['B19001009'] + \
-            data['B19001010']
-        curated_data.insert(2, 'Under $50K', under_50k)
-
-        fifty_to_100k = data['B19001011'] + data['B19001012'] + data['B19001013']
-        curated_data.insert(3, '$50K to $100K', fifty_to_100k)
-
-        hundred_to_200k = data['B19001014'] + data['B19001015'] + data['B19001016']
-        curated_data.insert(4, '$100K to $200K', hundred_to_200k)
-
-        curated_data.insert(5, 'Over $200K', data['B19001017'])
-
-    elif topic == 'poverty':
-        poverty = data['B17001004'] + data['B17001005'] + \
-            data['B17001006'] + data['B17001007'] + data['B17001008'] + \
-            data['B17001009'] + data['B17001018'] + data['B17001019'] + \
-            data['B17001020'] + data['B17001021'] + data['B17001022'] + \
-            data['B17001023']
-        curated_data.insert(2, 'Poverty, Children (Under 18)', poverty)
-
-        non_poverty = data['B17001033'] + data['B17001034'] + \
-            data['B17001035'] + data['B17001036'] + data['B17001037'] + \
-            data['B17001038'] + data['B17001047'] + data['B17001048'] + \
-            data['B17001049'] + data['B17001050'] + data['B17001051'] + \
-            data['B17001052']
-        curated_data.insert(3, 'Non-poverty, Children (Under 18)', non_poverty)
-
-        poverty = data['B17001015'] + data['B17001016'] + data['B17001029'] + data['B17001030']
-        curated_data.insert(4, 'Poverty, Seniors (65 and Over)', poverty)
-
-        non_poverty = data['B17001044'] + data['B17001045'] + data['B17001058'] + data['B17001059']
-        curated_data.insert(5, 'Non-poverty, Seniors (65 and Over)', non_poverty)
-
-    elif topic == 'transportation_to_work':
-        curated_data.insert(2, 'Drove Alone', data['B08006003'])
-        curated_data.insert(3, 'Carpooled', data['B08006004'])
-        curated_data.insert(4, 'Public Transit', data['B08006008'])
-        curated_data.insert(5, 'Bicycle', data['B08006014'])
-        curated_data.insert(6, 'Walked', data['B08006015'])
-        curated_data.insert(7, 'Other', data['B08006016'])
-        curated_data.insert(8, 'Worked at Home', data['B08006017'])
-
-    elif topic == 'population_by_household_type':
-        curated_data.insert(2, 'Married Couples', data['B11002003'])
-        curated_data.insert(3, 'Male Householder', data['B11002006'])
-        curated_data.insert(4, 'Female Householder', data['B11002009'])
-        curated_data.insert(5, 'Non-family', data['B11002012'])
-
-    elif topic == 'marital_status_by_sex':
-        curated_data.insert(2, 'Never Married: Male', data['B12001003'])
-        curated_data.insert(3, 'Never Married: Female', data['B12001012'])
-        curated_data.insert(4, 'Married: Male', data['B12001004'])
-        curated_data.insert(5, 'Married: Female', data['B12001013'])
-        curated_data.insert(6, 'Divorced: Male', data['B12001010'])
-        curated_data.insert(7, 'Divorced: Female', data['B12001019'])
-        curated_data.insert(8, 'Windowed: Male', data['B12001009'])
-        curated_data.insert(9, 'Windowed: Female', data['B12001018'])
-
-    elif topic == 'women_who_gave_birth_by_age':
-        curated_data.insert(2, '15 to 19', data['B13016003'])
-        curated_data.insert(3, '20 to 24', data['B13016004'])
-        curated_data.insert(4, '25 to 29', data['B13016005'])
-        curated_data.insert(5, '30 to 34', data['B13016006'])
-        curated_data.insert(6, '35 to 39', data['B13016007'])
-        curated_data.insert(7, '40 to 44', data['B13016008'])
-        curated_data.insert(8, '45 to 50', data['B13016009'])
-
-    elif topic == 'occupied_vs_vacant_housing':
-        curated_data.insert(2, 'Occupied', data['B25002002'])
-        curated_data.insert(3, 'Vacant', data['B25002003'])
-
-    elif topic == 'ownership_of_occupied_units':
-        curated_data.insert(2, 'Owner Occupied', data['B25003002'])
-        curated_data.insert(3, 'Renter Occupied', data['B25003003'])
-
-    elif topic == 'types_of_structure':
-        curated_data.insert(2, 'Single Unit', data['B25024002'] + data['B25024003'])
-        curated_data.insert(3, 'Multi-unit', data['B25024004'] + \
-            data['B25024005'] + data['B25024006'] + data['B25024007'] + \
-            data['B25024008'] + data['B25024009'])
-        curated_data.insert(4, 'Mobile Home', data['B25024010'])
-        curated_data.insert(5, 'Vehicle', data['B25024011'])
-
-    elif topic == 'year_moved_in_by_population':
-        curated_data.insert(2, 'Before 1970', data['B25026008'] + data['B25026015'])
-        curated_data.insert(3, '1970s', data['B25026007'] + data['B25026014'])
-        curated_data.insert(4, '1980s', data['B25026006'] + data['B25026013'])
-        curated_data.insert(5, '1990s', data['B25026005'] + data['B25026012'])
-        curated_data.insert(6, '2000 to 2004', data['B25026004'] + data['B25026011'])
-        curated_data.insert(7, 'Since 2005', data['B25026003'] + data['B25026010'])
-
-    elif topic == 'value_of_owner_occupied_housing_units':
-        curated_data.insert(2, 'Under $100K', data['B25075002'] + \
-            data['B25075003'] + data['B25075004'] + data['B25075005'] + \
-            data['B25075006'] + data['B25075007'] + data['B25075008'] + \
-            data['B25075009'] + data['B25075010'] + data['B25075011'] + \
-            data['B25075012'] + data['B25075013'] + data['B25075014'])
-        curated_data.insert(3, '$100K to $200K', data['B25075015'] + \
-            data['B25075016'] + data['B25075017'] + data['B25075018'])
-        curated_data.insert(4, '$200K to $300K', data['B25075019'] + data['B25075020'])
-        curated_data.insert(5, '$300K to $400K', data['B25075021'])
-        curated_data.insert(6, '$400K to $500K', data['B25075022'])
-        curated_data.insert(7, '$500K to $1M', data['B25075023'] + data['B25075024'])
-        curated_data.insert(8, 'Over $1M', data['B25075025'])
-
-    elif topic == 'population_migration_since_previous_year':
-        curated_data.insert(2, 'Same House Year Ago', data['B07003004'])
-        curated_data.insert(3, 'From Same County', data['B07003007'])
-        curated_data.insert(4, 'From Different County', data['B07003010'])
-        curated_data.insert(5, 'From Different State', data['B07003013'])
-        curated_data.insert(6, 'From Abroad', data['B07003016'])
-
-    elif topic == 'population_by_minimum_level_of_education':
-        curated_data.insert(2, 'No Degree', data['B15002003'] + \
-            data['B15002004'] + data['B15002005'] + data['B15002006'] + \
-            data['B15002007'] + data['B15002008'] + data['B15002009'] + \
-            data['B15002010'] + data['B15002020'] + data['B15002021'] + \
-            data['B15002022'] + data['B15002023'] + data['B15002024'] + \
-            data['B15002025'] + data['B15002026'] + data['B15002027'])
-        curated_data.insert(3, 'High School', data['B15002011'] + data['B15002028'])
-        curated_data.insert(4, 'Some college', data['B15002012'] + \
-            data['B15002013'] + data['B15002014'] + data['B15002029'] + \
-            data['B15002030'] + data['B15002031'])
-        curated_data.insert(5, 'Bachelor\'s', data['B15002015'] + data['B15002032'])
-        curated_data.insert(6, 'Post-grad', data['B15002016'] + \
-            data['B15002017'] + data['B15002018'] + data['B15002033'] + \
-            data['B15002034'] + data['B15002035'])
-
-    elif topic == 'language_at_home_children':
-        curated_data.insert(2, 'English Only', data['B16007003'])
-        curated_data.insert(3, 'Spanish', data['B16007004'])
-        curated_data.insert(4, 'Indo-European', data['B16007005'])
-        curated_data.insert(5, 'Asian/Islander', data['B16007006'])
-        curated_data.insert(6, 'Other', data['B16007007'])
-
-    elif topic == 'language_at_home_adults':
-        curated_data.insert(2, 'English Only', data['B16007009'] + data['B16007015'])
-        curated_data.insert(3, 'Spanish', data['B16007010'] + data['B16007016'])
-        curated_data.insert(4, 'Indo-European', data['B16007011'] + data['B16007017'])
-        curated_data.insert(5, 'Asian/Islander', data['B16007012'] + data['B16007018'])
-        curated_data.insert(6, 'Other', data['B16007013'] + data['B16007019'])
-
-    elif topic == 'place_of_birth_for_foreign_born_population':
-        curated_data.insert(2, 'Europe', data['B05006002'])
-        curated_data.insert(3, 'Asia', data['B05006047'])
-        curated_data.insert(4, 'Africa', data['B05006091'])
-        curated_data.insert(5, 'Oceania', data['B05006116'])
-        curated_data.insert(6, 'Latin America', data['B05006123'])
-        curated_data.insert(7, 'North America', data['B05006159'])
-
-    elif topic == 'veterans_by_wartime_service':
-        curated_data.insert(2, 'WWII', data['B21002009'] + data['B21002011'] + data['B21002012'])
-        curated_data.insert(3, 'Korea', data['B21002008'] + data['B21002009'] + data['B21002010'] + data['B21002011'])
-        curated_data.insert(4, 'Vietnam', data['B21002004'] + data['B21002006'] + data['B21002007'] + data['B21002008'] + data['B21002009'])
-        curated_data.insert(5, 'Gulf (1990s)', data['B21002003'] + data['B21002004'] + data['B21002005'] + data['B21002006'])
-        curated_data.insert(6, 'Gulf (2001-)', data['B21002002'] + data['B21002003'] + data['B21002004'])
-
-    curated_data.reset_index(drop=True, inplace=True)
-
-    return curated_data
+# Curated output columns for each topic: (column name, [source column ids]).
+# Each output column is the sum of its source columns.
+TOPIC_COLUMNS = {
+    'age': [
+        ('Under 18', ['B01001003', 'B01001004', 'B01001005', 'B01001006',
+                      'B01001027', 'B01001028', 'B01001029', 'B01001030']),
+        ('18 to 64', ['B01001007', 'B01001008', 'B01001009', 'B01001010',
+                      'B01001011', 'B01001012', 'B01001013', 'B01001014',
+                      'B01001015', 'B01001016', 'B01001017', 'B01001018',
+                      'B01001019', 'B01001031', 'B01001032', 'B01001033',
+                      'B01001034', 'B01001035', 'B01001036', 'B01001037',
+                      'B01001038', 'B01001039', 'B01001040', 'B01001041',
+                      'B01001042', 'B01001043']),
+        ('Over 65', ['B01001020', 'B01001021', 'B01001022', 'B01001023',
+                     'B01001024', 'B01001025', 'B01001044', 'B01001045',
+                     'B01001046', 'B01001047', 'B01001048', 'B01001049']),
+    ],
+    'sex': [
+        ('Male', ['B01001002']),
+        ('Female', ['B01001026']),
+    ],
+    # This column order is what users' workflows have always received.
+    'race': [
+        ('White', ['B03002003']),
+        ('Black', ['B03002004']),
+        ('Native', ['B03002005']),
+        ('Two or More', ['B03002009']),
+        ('Hispanic', ['B03002012']),
+        ('Other', ['B03002008']),
+        ('Islander', ['B03002007']),
+        ('Asian', ['B03002006']),
+    ],
+    'household_income': [
+        ('Under $50K', ['B19001002', 'B19001003', 'B19001004', 'B19001005',
+                        'B19001006', 'B19001007', 'B19001008', 'B19001009',
+                        'B19001010']),
+        ('$50K to $100K', ['B19001011', 'B19001012', 'B19001013']),
+        ('$100K to $200K', ['B19001014', 'B19001015', 'B19001016']),
+        ('Over $200K', ['B19001017']),
+    ],
+    'poverty': [
+        ('Poverty, Children (Under 18)', [
+            'B17001004', 'B17001005', 'B17001006', 'B17001007', 'B17001008',
+            'B17001009', 'B17001018', 'B17001019', 'B17001020', 'B17001021',
+            'B17001022', 'B17001023']),
+        ('Non-poverty, Children (Under 18)', [
+            'B17001033', 'B17001034', 'B17001035', 'B17001036', 'B17001037',
+            'B17001038', 'B17001047', 'B17001048', 'B17001049', 'B17001050',
+            'B17001051', 'B17001052']),
+        ('Poverty, Seniors (65 and Over)', [
+            'B17001015', 'B17001016', 'B17001029', 'B17001030']),
+        ('Non-poverty, Seniors (65 and Over)', [
+            'B17001044', 'B17001045', 'B17001058', 'B17001059']),
+    ],
+    'transportation_to_work': [
+        ('Drove Alone', ['B08006003']),
+        ('Carpooled', ['B08006004']),
+        ('Public Transit', ['B08006008']),
+        ('Bicycle', ['B08006014']),
+        ('Walked', ['B08006015']),
+        ('Other', ['B08006016']),
+        ('Worked at Home', ['B08006017']),
+    ],
+    'population_by_household_type': [
+        ('Married Couples', ['B11002003']),
+        ('Male Householder', ['B11002006']),
+        ('Female Householder', ['B11002009']),
+        ('Non-family', ['B11002012']),
+    ],
+    'marital_status_by_sex': [
+        ('Never Married: Male', ['B12001003']),
+        ('Never Married: Female', ['B12001012']),
+        ('Married: Male', ['B12001004']),
+        ('Married: Female', ['B12001013']),
+        ('Divorced: Male', ['B12001010']),
+        ('Divorced: Female', ['B12001019']),
+        ('Windowed: Male', ['B12001009']),
+        ('Windowed: Female', ['B12001018']),
+    ],
+    'women_who_gave_birth_by_age': [
+        ('15 to 19', ['B13016003']),
+        ('20 to 24', ['B13016004']),
+        ('25 to 29', ['B13016005']),
+        ('30 to 34', ['B13016006']),
+        ('35 to 39', ['B13016007']),
+        ('40 to 44', ['B13016008']),
+        ('45 to 50', ['B13016009']),
+    ],
+    'occupied_vs_vacant_housing': [
+        ('Occupied', ['B25002002']),
+        ('Vacant', ['B25002003']),
+    ],
+    'ownership_of_occupied_units': [
+        ('Owner Occupied', ['B25003002']),
+        ('Renter Occupied', ['B25003003']),
+    ],
+    'types_of_structure': [
+        ('Single Unit', ['B25024002', 'B25024003']),
+        ('Multi-unit', ['B25024004', 'B25024005', 'B25024006', 'B25024007',
+                        'B25024008', 'B25024009']),
+        ('Mobile Home', ['B25024010']),
+        ('Vehicle', ['B25024011']),
+    ],
+    'year_moved_in_by_population': [
+        ('Before 1970', ['B25026008', 'B25026015']),
+        ('1970s', ['B25026007', 'B25026014']),
+        ('1980s', ['B25026006', 'B25026013']),
+        ('1990s', ['B25026005', 'B25026012']),
+        ('2000 to 2004', ['B25026004', 'B25026011']),
+        ('Since 2005', ['B25026003', 'B25026010']),
+    ],
+    'value_of_owner_occupied_housing_units': [
+        ('Under $100K', ['B25075002', 'B25075003', 'B25075004', 'B25075005',
+                         'B25075006', 'B25075007', 'B25075008', 'B25075009',
+                         'B25075010', 'B25075011', 'B25075012', 'B25075013',
+                         'B25075014']),
+        ('$100K to $200K', ['B25075015', 'B25075016', 'B25075017',
+                            'B25075018']),
+        ('$200K to $300K', ['B25075019', 'B25075020']),
+        ('$300K to $400K', ['B25075021']),
+        ('$400K to $500K', ['B25075022']),
+        ('$500K to $1M', ['B25075023', 'B25075024']),
+        ('Over $1M', ['B25075025']),
+    ],
+    'population_migration_since_previous_year': [
+        ('Same House Year Ago', ['B07003004']),
+        ('From Same County', ['B07003007']),
+        ('From Different County', ['B07003010']),
+        ('From Different State', ['B07003013']),
+        ('From Abroad', ['B07003016']),
+    ],
+    'population_by_minimum_level_of_education': [
+        ('No Degree', ['B15002003', 'B15002004', 'B15002005', 'B15002006',
+                       'B15002007', 'B15002008', 'B15002009', 'B15002010',
+                       'B15002020', 'B15002021', 'B15002022', 'B15002023',
+                       'B15002024', 'B15002025', 'B15002026', 'B15002027']),
+        ('High School', ['B15002011', 'B15002028']),
+        ('Some college', ['B15002012', 'B15002013', 'B15002014',
+                          'B15002029', 'B15002030', 'B15002031']),
+        ('Bachelor\'s', ['B15002015', 'B15002032']),
+        ('Post-grad', ['B15002016', 'B15002017', 'B15002018', 'B15002033',
+                       'B15002034', 'B15002035']),
+    ],
+    'language_at_home_children': [
+        ('English Only', ['B16007003']),
+        ('Spanish', ['B16007004']),
+        ('Indo-European', ['B16007005']),
+        ('Asian/Islander', ['B16007006']),
+        ('Other', ['B16007007']),
+    ],
+    'language_at_home_adults': [
+        ('English Only', ['B16007009', 'B16007015']),
+        ('Spanish', ['B16007010', 'B16007016']),
+        ('Indo-European', ['B16007011', 'B16007017']),
+        ('Asian/Islander', ['B16007012', 'B16007018']),
+        ('Other', ['B16007013', 'B16007019']),
+    ],
+    'place_of_birth_for_foreign_born_population': [
+        ('Europe', ['B05006002']),
+        ('Asia', ['B05006047']),
+        ('Africa', ['B05006091']),
+        ('Oceania', ['B05006116']),
+        ('Latin America', ['B05006123']),
+        ('North America', ['B05006159']),
+    ],
+    'veterans_by_wartime_service': [
+        ('WWII', ['B21002009', 'B21002011', 'B21002012']),
+        ('Korea', ['B21002008', 'B21002009', 'B21002010', 'B21002011']),
+        ('Vietnam', ['B21002004', 'B21002006', 'B21002007', 'B21002008',
+                     'B21002009']),
+        ('Gulf (1990s)', ['B21002003', 'B21002004', 'B21002005',
+                          'B21002006']),
+        ('Gulf (2001-)', ['B21002002', 'B21002003', 'B21002004']),
+    ],
+}
+
+
+class TopicAggregation(collections.namedtuple('TopicAggregation',
+                                              ['names', 'column_ids',
+                                               'sources'])):
+    """
+    A topic's compiled spec: its output column `names`, its sorted source
+    `column_ids` and, for each output column, the indexes of its sources.
+
+    `matrix` has one row per source column and one column per output
+    column: curating is `estimates @ matrix`. It's built on first use, so
+    importing this module needs no numpy.
+    """
+    @property
+    def matrix(self):
+        matrix = self.__dict__.get('_matrix')
+        if matrix is None:
+            matrix = np.zeros((len(self.column_ids), len(self.names)))
+            for j, rows in enumerate(self.sources):
+                matrix[rows, j] = 1.0
+            self.__dict__['_matrix'] = matrix
+        return matrix
+
+
+def _compile_topic_columns(topic_columns, topic_tables):
+    """
+    Turn each topic's spec into a TopicAggregation.
+
+    Raises ValueError if a topic is missing from either dict or a spec names
+    a column outside its topic's table.
+    """
+    if set(topic_columns) != set(topic_tables):
+        raise ValueError('TOPIC_COLUMNS and TOPIC_TABLES topics differ: %r'
+                         % sorted(set(topic_columns) ^ set(topic_tables)))
+
+    result = {}
+    for topic, spec in topic_columns.items():
+        table_id = topic_tables[topic]
+        column_ids = sorted(set(column_id for _, ids in spec
+                                for column_id in ids))
+        for column_id in column_ids:
+            if not (column_id.startswith(table_id)
+                    and len(column_id) == len(table_id) + 3
+                    and column_id[-3:].isdigit()):
+                raise ValueError('Topic %r uses column %r, which is not in '
+                                 'table %s' % (topic, column_id, table_id))
+
+        row_index = dict((column_id, i) for i, column_id in enumerate(column_ids))
+        sources = [[row_index[column_id] for column_id in ids]
+                   for _, ids in spec]
+        result[topic] = TopicAggregation([name for name, _ in spec],
+                                         column_ids, sources)
+    return result
+
+
+TOPIC_AGGREGATIONS = _compile_topic_columns(TOPIC_COLUMNS, TOPIC_TABLES)
+
+
+def _aggregate(values, matrix, out=None):
+    """
+    Compute `values @ matrix`, with NaN wherever a summed input is NaN.
+
+    That's what adding pandas Series would give; a plain matrix product
+    would also spread NaN into columns that give the input zero weight.
+    The result is written to `out` if given.
+    """
+    missing = np.isnan(values)
+    result = np.matmul(np.where(missing, 0.0, values), matrix, out=out)
+    # Count each sum's missing inputs: a float product, because BLAS
+    # doesn't do booleans
+    n_missing = np.matmul(missing, (matrix != 0).astype(float))
+    np.copyto(result, np.nan, where=n_missing > 0)
+    return result
+
+
+def _aggregate_moe(errors, matrix, out=None):
+    """
+    Compute the margin of error of `values @ matrix`, given each value's
+    margin of error: the root sum of squares of the summed inputs' errors.
+
+    As with _aggregate(), a NaN input error makes its sums' errors NaN.
+    """
+    result = _aggregate(np.square(errors), np.square(matrix), out=out)
+    return np.sqrt(result, out=result)
+
+
+def _curate(topic, data, geography, include_moe=False, compact=False):
+    """
+    Build `topic`'s curated frame from a prepped `data` frame (indexed by
+    geoid, with columns from any number of tables) and a response's
+    'geography'.
+
+    With `include_moe`, `data` must have '_moe' columns, and each curated
+    column is followed by its margin of error, '<column>_moe'. With
+    `compact`, columns have compact dtypes: see _compact_values().
+    """
+    with _stage('curate', topic=topic) as stage:
+        # The first geography is the parent; the rest are the rows we return.
+        row_geoids = list(geography.keys())[1:]
+        names = [geography[geoid]['name'] for geoid in row_geoids]
+        parsed_geoids = sorted(geography.keys())[1:]
+
+        aggregation = TOPIC_AGGREGATIONS[topic]
+        estimates = data.reindex(index=row_geoids,
+                                 columns=aggregation.column_ids).to_numpy(dtype=float)
+        curated = _aggregate(estimates, aggregation.matrix)
+        if include_moe:
+            errors = data.reindex(
+                index=row_geoids,
+                columns=[column_id + '_moe'
+                         for column_id in aggregation.column_ids]
+            ).to_numpy(dtype=float)
+            curated_moe = _aggregate_moe(errors, aggregation.matrix)
+
+        if compact:
+            columns = {'name': _compact_text(names),
+                       'geoid': _compact_text(parsed_geoids)}
+            curated = _compact_values(curated)
+            if include_moe:
+                curated_moe = _compact_values(curated_moe)
+        else:
+            columns = {'name': names, 'geoid': parsed_geoids}
+            curated = curated.T
+            if include_moe:
+                curated_moe = curated_moe.T
+        for i, column_name in enumerate(aggregation.names):
+            columns[column_name] = curated[i]
+            if include_moe:
+                columns[column_name + '_moe'] = curated_moe[i]
+        frame = pd.DataFrame(columns, copy=not compact)
+        stage.set('rows', frame.shape[0])
+        stage.set('columns', frame.shape[1])
+    return frame
+
+
+def _select(data, row_geoids, column_ids):
+    """
+    Return `data`'s values for `row_geoids` and `column_ids` as a 2-D
+    array, NaN where `data` lacks a row or column: like reindex(), but
+    straight from the underlying array.
+    """
+    rows = data.index.get_indexer(row_geoids)
+    columns = data.columns.get_indexer(column_ids)
+    values = data.to_numpy(dtype=float)[np.ix_(rows, columns)]
+    values[rows < 0] = np.nan
+    values[:, columns < 0] = np.nan
+    return values
+
+
+def _curate_arrow(topic, data, geography, include_moe=False):
+    """
+    Like _curate(), but return a pyarrow.Table.
+
+    Each curated column is computed straight into the buffer the Arrow
+    array wraps, so no values are copied after the matrix product. NaN
+    values become nulls.
+    """
+    with _stage('curate', topic=topic) as stage:
+        row_geoids = list(geography.keys())[1:]
+        names = [geography[geoid]['name'] for geoid in row_geoids]
+        parsed_geoids = sorted(geography.keys())[1:]
+
+        aggregation = TOPIC_AGGREGATIONS[topic]
+        n_columns = len(aggregation.names)
+        # One row per output column, so each column is contiguous
+        buffers = np.empty((n_columns * (2 if include_moe else 1),
+                            len(row_geoids)))
+        estimates = _select(data, row_geoids, aggregation.column_ids)
+        _aggregate(estimates, aggregation.matrix, out=buffers[:n_columns].T)
+        if include_moe:
+            errors = _select(data, row_geoids,
+                             [column_id + '_moe'
+                              for column_id in aggregation.column_ids])
+            _aggregate_moe(errors, aggregation.matrix,
+                           out=buffers[n_columns:].T)
+
+        arrays = [pa.array(names, pa.string()),
+                  pa.array(parsed_geoids, pa.string())]
+        column_names = ['name', 'geoid']
+        for i, column_name in enumerate(aggregation.names):
+            arrays.append(pa.array(buffers[i], from_pandas=True))
+            column_names.append(column_name)
+            if include_moe:
+                arrays.append(pa.array(buffers[n_columns + i],
+                                       from_pandas=True))
+                column_names.append(column_name + '_moe')
+        table = pa.table(arrays, names=column_names)
+        stage.set('rows', table.num_rows)
+        stage.set('columns', table.num_columns)
+    return table
+
+
+def _require_pyarrow():
+    """Import pyarrow now: raise ImportError before fetching, not after."""
+    global pa
+    import pyarrow
+    pa = pyarrow
+
+
+def get_table_simple(topic, geo, include_moe=False, release='latest',
+                     stale_while_revalidate=False):
+    """
+    Like get_dataframe_simple(), but return a pyarrow.Table.
+
+    The response is still parsed into a pandas frame, but only to look up
+    its values: they're curated straight into the buffers the Arrow arrays
+    wrap, so no curated frame is built and nothing is copied after that.
+    """
+    _require_pyarrow()
+    response = get_columnar(tables=[TOPIC_TABLES[topic]], geoids=geo,
+                            release=release, include_moe=include_moe,
+                            stale_while_revalidate=stale_while_revalidate)
+    return _curate_arrow(topic, response.data, response.geography,
+                         include_moe)
+
+
+def _concat_tables_unique(tables):
+    """
+    Concatenate pyarrow.Tables, keeping only the first row for each geoid:
+    get_dataframe_simple_bulk()'s concat and drop_duplicates().
+    """
+    table = pa.concat_tables(tables)
+    geoids = table.column('geoid').to_numpy()
+    _, first = np.unique(geoids, return_index=True)
+    if len(first) < table.num_rows:
+        table = table.take(np.sort(first))
+    return table
+
+
+# key => [Future of the call computing it, number of callers waiting on it]
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _single_flight(key, fn, copy):
+    """
+    Return fn(); or, if a call with the same `key` is already running in
+    another thread, wait for it and return copy(its result).
+
+    The running call hands its waiters a copy made before it returns, so
+    they never see what its own caller does to the result afterwards.
+    """
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = [concurrent.futures.Future(), 0]
+        else:
+            flight[1] += 1
+    future = flight[0]
+    if not leader:
+        _emit('coalesce', key=repr(key))
+        return copy(future.result())
+
+    try:
+        result = fn()
+    except BaseException as err:
+        with _in_flight_lock:
+            del _in_flight[key]
+        future.set_exception(err)
+        raise
+    with _in_flight_lock:
+        del _in_flight[key]  # no more waiters can join
+    future.set_result(copy(result) if flight[1] else None)
+    return result
+
+
+def get_dataframes_simple(topics, geo, wide=False, include_moe=False,
+                          release='latest', compact=False,
+                          stale_while_revalidate=False):
+    """
+    Curate several topics for one geography from a single API request.
+
+    Topics that share a table (e.g., 'age' and 'sex') share its download.
+    Returns a dict of topic => frame, or with `wide=True` one frame with
+    'name', 'geoid' and then every topic's columns, named 'topic: column'.
+    With `include_moe`, each column is followed by its margin of error.
+    With `compact`, counts are nullable Int32 and 'name' and 'geoid' are
+    compact strings: see _compact_values() and _compact_text().
+    With `stale_while_revalidate`, expired cached responses are used as is
+    and refreshed in the background.
+
+    Identical calls running at once in other threads share one result;
+    each caller gets its own copy of the frames.
+    """
+    topics = list(topics)
+    key = ('get_dataframes_simple', tuple(topics),
+           urllib.parse.unquote(geo), wide, include_moe, release, compact,
+           stale_while_revalidate)
+    if wide:
+        copy = pd.DataFrame.copy
+    else:
+        def copy(frames):
+            return dict((topic, frame.copy())
+                        for topic, frame in frames.items())
+    return _single_flight(
+        key,
+        lambda: _get_dataframes_simple(topics, geo, wide, include_moe,
+                                       release, compact,
+                                       stale_while_revalidate),
+        copy
+    )
+
+
+def _get_dataframes_simple(topics, geo, wide, include_moe, release, compact,
+                           stale_while_revalidate):
+    tables = list(dict.fromkeys(TOPIC_TABLES[topic] for topic in topics))
+    response = get_columnar(tables=tables, geoids=geo, release=release,
+                            include_moe=include_moe,
+                            stale_while_revalidate=stale_while_revalidate)
+
+    frames = dict((topic, _curate(topic, response.data, response.geography,
+                                  include_moe, compact))
+                  for topic in topics)
+    if not wide:
+        return frames
+
+    columns = {}
+    for topic, frame in frames.items():
+        columns.setdefault('name', frame['name'])
+        columns.setdefault('geoid', frame['geoid'])
+        for column_name in frame.columns[2:]:
+            columns['%s: %s' % (topic, column_name)] = frame[column_name]
+    return pd.DataFrame(columns, copy=not compact)
+
+
+def get_dataframe_simple(topic, geo, include_moe=False, release='latest',
+                         compact=False, stale_while_revalidate=False):
+    return get_dataframes_simple(
+        [topic], geo, include_moe=include_moe, release=release,
+        compact=compact, stale_while_revalidate=stale_while_revalidate
+    )[topic]
+
+
+def get_dataframe_simple_bulk(topic, geos, include_moe=False, compact=False,
+                              stale_while_revalidate=False):
+    """
+    Curate `topic` for each of `geos` (e.g., one '050|04000USxx' per state),
+    fetching concurrently, and concatenate the results.
+
+    A geography that appears under several parents (a metro area spanning
+    states) appears once in the output.
+    """
+    frames = _map_concurrently(
+        lambda geo: get_dataframe_simple(
+            topic, geo, include_moe,
+            stale_while_revalidate=stale_while_revalidate
+        ),
+        geos
+    )
+    result = pd.concat(frames, ignore_index=True)
+    result.drop_duplicates('geoid', inplace=True, ignore_index=True)
+    if compact:
+        # After concat: categoricals with differing categories don't concat
+        result = _compact_frame(result)
+    return result
+
+
+def get_dataframe_panel(topic, geo, releases, include_moe=False):
+    """
+    Curate `topic` for `geo` in each of `releases` (e.g., 'acs2012_5yr'
+    through 'acs2017_5yr'), fetching the releases concurrently.
+
+    Returns one row per geoid and release, grouped by geoid with releases in
+    the order given: 'release', 'name' (from the last release that has the
+    geoid), 'geoid', the topic's columns and then each column's change since
+    the previous release, '<column>_change'. A geoid missing from a release
+    has NaN values there. With `include_moe`, each change is followed by its
+    margin of error, '<column>_change_moe'.
+
+    Named releases never change, so they're cached forever (see
+    CACHE_DEFAULT_TTL): adding a release to a panel fetches only that one.
+    """
+    releases = list(releases)
+    frames = _map_concurrently(
+        lambda release: get_dataframe_simple(topic, geo, include_moe, release),
+        releases
+    )
+    for release, frame in zip(releases, frames):
+        frame.insert(0, 'release', release)
+    stacked = pd.concat(frames, ignore_index=True)
+
+    value_columns = [column for column in stacked.columns[3:]
+                     if not column.endswith('_moe')]
+    geoids = pd.unique(stacked['geoid'])
+    names = stacked.drop_duplicates('geoid', keep='last') \
+        .set_index('geoid')['name']
+    panel = stacked.set_index(['geoid', 'release']).reindex(
+        pd.MultiIndex.from_product([geoids, releases],
+                                   names=['geoid', 'release'])
+    )
+
+    by_geoid = panel.groupby(level='geoid', sort=False)
+    changes = panel[value_columns] - by_geoid[value_columns].shift()
+    for column in value_columns:
+        panel[column + '_change'] = changes[column]
+        if include_moe:
+            moe = panel[column + '_moe']
+            previous_moe = by_geoid[column + '_moe'].shift()
+            panel[column + '_change_moe'] = np.sqrt(moe ** 2 +
+                                                    previous_moe ** 2)
+
+    panel.reset_index(inplace=True)
+    panel['name'] = names.reindex(panel['geoid']).to_numpy()
+    return panel[['release', 'name', 'geoid'] + list(panel.columns[3:])]
+
+
+def _render_geo(sumlevel, state_code):
+    """
+    Return the geography render() curates: a containment query, or for
+    state_code 'all' a list of them, one per state.
+    """
+    if sumlevel == 'all_states':
+        return ALL_STATES_GEO
+    geo_prefix = SUMLEVEL_GEO_PREFIXES[sumlevel]
+    if state_code == 'all':
+        return [geo_prefix + state_fips for state_fips in STATE_FIPS.values()]
+    return geo_prefix + STATE_FIPS[state_code]
+
+
+# Rollup store: render()'s result for every topic, sumlevel and statecode,
+# precomputed so a render is a keyed read. Each topic is a directory of
+# .npy files, memory-mapped on read, holding every rollup's rows back to
+# back; meta.json maps each rollup key ('counties|ca', 'all_states') to its
+# row range and stamps the release it was built from and when. Set
+# ROLLUP_DIR to use one; see precompute_rollups().
+ROLLUP_DIR = os.environ.get('ACS2016_ROLLUP_DIR') or None
+
+# topic path => (meta.json mtime, meta, arrays), like _snapshot_tables
+_rollup_topics = {}
+
+
+def _rollup_key(sumlevel, state_code):
+    if sumlevel == 'all_states':
+        return sumlevel
+    return sumlevel + '|' + state_code
+
+
+def _load_rollup_topic(topic):
+    path = os.path.join(ROLLUP_DIR, topic)
+    try:
+        mtime = os.path.getmtime(os.path.join(path, 'meta.json'))
+    except OSError:
+        return None
+    loaded = _rollup_topics.get(path)
+    if loaded is None or loaded[0] != mtime:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = dict(
+            (name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+            for name in ('names', 'geoids', 'values')
+        )
+        loaded = _rollup_topics[path] = (mtime, meta, arrays)
+    return loaded[1:]
+
+
+def _rollup_arrays(topic, sumlevel, state_code, release='latest'):
+    """
+    Return (column names, names, geoids, values) for render()'s result
+    from the rollup store, or None if it isn't there or is stale. They're
+    slices of the memory-mapped files.
+
+    A rollup is stale if it was built for another release. For a release
+    with a CACHE_TTL, such as 'latest', it's also stale if a response
+    fetched within the TTL names another release id than the rollup was
+    built from; with no such response, if the rollup is older than the TTL.
+    """
+    loaded = _load_rollup_topic(topic)
+    if loaded is None:
+        return None
+    meta, arrays = loaded
+    if meta['release'] != release:
+        return None
+    ttl = CACHE_TTL.get(release, CACHE_DEFAULT_TTL)
+    if ttl is not None:
+        known = _known_releases().get(release)
+        if known is not None and time.time() - known['checked'] <= ttl:
+            if meta.get('release_id') != known['id']:
+                return None
+        elif time.time() - meta['created'] > ttl:
+            return None
+    row_range = meta['rollups'].get(_rollup_key(sumlevel, state_code))
+    if row_range is None:
+        return None
+
+    start, stop = row_range
+    return (meta['columns'], arrays['names'][start:stop],
+            arrays['geoids'][start:stop], arrays['values'][start:stop])
+
+
+def _rollup_frame(topic, sumlevel, state_code, release='latest'):
+    """Return render()'s result from the rollup store, or None."""
+    rollup = _rollup_arrays(topic, sumlevel, state_code, release)
+    if rollup is None:
+        return None
+
+    column_names, names, geoids, values = rollup
+    columns = {
+        'name': names.astype(object),
+        'geoid': geoids.astype(object),
+    }
+    for i, column_name in enumerate(column_names):
+        columns[column_name] = values[:, i]
+    return pd.DataFrame(columns)
+
+
+def _rollup_table(topic, sumlevel, state_code, release='latest'):
+    """
+    Return render_arrow()'s result from the rollup store, or None.
+
+    Values are stored column by column, so each Arrow column wraps the
+    memory-mapped file instead of copying it.
+    """
+    rollup = _rollup_arrays(topic, sumlevel, state_code, release)
+    if rollup is None:
+        return None
+
+    column_names, names, geoids, values = rollup
+    arrays = [pa.array(names, pa.string()), pa.array(geoids, pa.string())]
+    arrays.extend(pa.array(values[:, i], from_pandas=True)
+                  for i in range(len(column_names)))
+    return pa.table(arrays, names=['name', 'geoid'] + column_names)
+
+
+def precompute_rollups(rollup_dir, topics=None, release='latest'):
+    """
+    Curate `topics` (default: every topic in TOPIC_TABLES) for every
+    sumlevel and statecode render() accepts, and write them as a rollup
+    store.
+
+    Each geography is fetched once, for all topics together. Each topic is
+    written to a temporary directory and swapped in whole, so renders never
+    see a half-written topic. Run this again to refresh a stale store.
+    """
+    if topics is None:
+        topics = list(TOPIC_TABLES)
+    created = time.time()
+
+    geos = [('all_states', None)]
+    for sumlevel in SUMLEVEL_GEO_PREFIXES:
+        for state_code in STATE_FIPS:
+            geos.append((sumlevel, state_code))
+    results = _map_concurrently(
+        lambda geo: get_dataframes_simple(topics, _render_geo(*geo),
+                                          release=release),
+        geos
+    )
+    frames_by_key = dict((_rollup_key(*geo), frames)
+                         for geo, frames in zip(geos, results))
+    # The release id the responses just parsed named, if any
+    release_id = _known_releases().get(release, {}).get('id')
+
+    for sumlevel in SUMLEVEL_GEO_PREFIXES:
+        # Like get_dataframe_simple_bulk(), from the states' frames
+        all_frames = {}
+        for topic in topics:
+            state_frames = [frames_by_key[_rollup_key(sumlevel, state)][topic]
+                            for state in STATE_FIPS]
+            frame = pd.concat(state_frames, ignore_index=True)
+            frame.drop_duplicates('geoid', inplace=True, ignore_index=True)
+            all_frames[topic] = frame
+        frames_by_key[_rollup_key(sumlevel, 'all')] = all_frames
+
+    for topic in topics:
+        rollups = {}
+        frames = []
+        n_rows = 0
+        for key, topic_frames in frames_by_key.items():
+            frame = topic_frames[topic]
+            rollups[key] = [n_rows, n_rows + len(frame)]
+            n_rows += len(frame)
+            frames.append(frame)
+        frame = pd.concat(frames, ignore_index=True)
+        arrays = {
+            'names': frame['name'].to_numpy(dtype=str),
+            'geoids': frame['geoid'].to_numpy(dtype=str),
+            # Column by column: see _rollup_table()
+            'values': np.asfortranarray(
+                frame.iloc[:, 2:].to_numpy(dtype=float)
+            ),
+        }
+        meta = {
+            'topic': topic,
+            'release': release,
+            'release_id': release_id,
+            'created': created,
+            'columns': list(frame.columns[2:]),
+            'rollups': rollups,
+        }
+        _write_array_dir(rollup_dir, topic, arrays, meta)
 
 
 # TODO make this fetch(), not render().
@@ -339,21 +2511,62 @@ def render(table, params):
     topic = params['topic']
     sumlevel = params['sumlevel']
 
-    if sumlevel == 'all_states':
-        geo = "040%7C01000US"
-    else:
-        state_code = params['statecode']
-        state_fips = STATE_FIPS[state_code]
-        geo_prefix = {
-            'counties': '050%7C04000US',
-            'places': '160%7C04000US',
-            'metro_areas': '310%7C04000US',
-        }[sumlevel]
-        geo = geo_prefix + state_fips
+    with _stage('render', topic=topic, sumlevel=sumlevel,
+                statecode=params.get('statecode')) as stage:
+        result = None
+        if ROLLUP_DIR is not None:
+            result = _rollup_frame(topic, sumlevel, params.get('statecode'))
+            _emit('rollup', hit=result is not None)
 
+        if result is None:
+            # Expired data now beats fresh data later: refresh afterwards.
+            geo = _render_geo(sumlevel, params.get('statecode'))
+            if isinstance(geo, list):
+                result = get_dataframe_simple_bulk(
+                    topic, geo, stale_while_revalidate=True
+                )
+            else:
+                # result = get_dataframe(topic, geo, geo_names=True, col_names=True)
+                result = get_dataframe_simple(topic, geo,
+                                              stale_while_revalidate=True)
+        stage.set('rows', result.shape[0])
+        stage.set('columns', result.shape[1])
 
-    # return get_dataframe(topic, geo, geo_names=True, col_names=True)
-    return get_dataframe_simple(topic, geo)
+    return result
+
+
+def render_arrow(table, params):
+    """
+    Like render(), but return a pyarrow.Table: see get_table_simple(). From
+    the rollup store, the Arrow arrays wrap its memory-mapped values with no
+    pandas frame at all. Needs pyarrow.
+    """
+    _require_pyarrow()
+    topic = params['topic']
+    sumlevel = params['sumlevel']
+
+    with _stage('render', topic=topic, sumlevel=sumlevel,
+                statecode=params.get('statecode')) as stage:
+        result = None
+        if ROLLUP_DIR is not None:
+            result = _rollup_table(topic, sumlevel, params.get('statecode'))
+            _emit('rollup', hit=result is not None)
+
+        if result is None:
+            geo = _render_geo(sumlevel, params.get('statecode'))
+            tables = _map_concurrently(
+                lambda geo: get_table_simple(topic, geo,
+                                             stale_while_revalidate=True),
+                geo if isinstance(geo, list) else [geo]
+            )
+            if len(tables) == 1:
+                result = tables[0]
+            else:
+                result = _concat_tables_unique(tables)
+        stage.set('rows', result.num_rows)
+        stage.set('columns', result.num_columns)
+
+    return result
 
 
 # Do not modify these: they're for _migrate_params_v0_to_v1, which must do the
@@ -418,6 +2631,34 @@ def migrate_params(params):
 
 
 if __name__ == "__main__":
-    dframe = render(None, {'topic': 'sex', 'sumlevel': 'counties',
-                           'statecode': 'al'})
-    print(dframe)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    ingest_parser = commands.add_parser(
+        'ingest',
+        help='download ACS tables into a snapshot directory for SNAPSHOT_DIR'
+    )
+    ingest_parser.add_argument('snapshot_dir')
+    ingest_parser.add_argument('tables', nargs='*',
+                               help='table ids (default: all TOPIC_TABLES)')
+    ingest_parser.add_argument('--release', default='latest')
+    precompute_parser = commands.add_parser(
+        'precompute',
+        help='curate every render() result into a rollup directory for '
+             'ROLLUP_DIR'
+    )
+    precompute_parser.add_argument('rollup_dir')
+    precompute_parser.add_argument('topics', nargs='*',
+                                   help='topics (default: all TOPIC_TABLES)')
+    precompute_parser.add_argument('--release', default='latest')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        ingest_snapshot(args.snapshot_dir, args.tables or None, args.release)
+    elif args.command == 'precompute':
+        precompute_rollups(args.rollup_dir, args.topics or None, args.release)
+    else:
+        dframe = render(None, {'topic': 'sex', 'sumlevel': 'counties',
+                               'statecode': 'al'})
+        print(dframe)
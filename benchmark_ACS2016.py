@@ -0,0 +1,427 @@
+"""
+Offline benchmarks for ACS2016, against a local Census Reporter stand-in.
+
+The stand-in serves /1.0/data/show/{release} responses: recorded fixtures
+when it has one for the request, synthetic data shaped like the real API
+otherwise. Every render(), get_dataframe() and get_dataframe_simple() call
+goes through the real HTTP and parsing code; only the server is fake.
+
+    python benchmark_ACS2016.py                         # print results
+    python benchmark_ACS2016.py --save-baseline b.json  # record a baseline
+    python benchmark_ACS2016.py --baseline b.json       # exit 1 on regression
+    python benchmark_ACS2016.py --fixtures f/ --record  # save real responses
+    python benchmark_ACS2016.py --startup               # cold-start cases
+
+Each case reports latency percentiles over --repeat runs, peak traced
+memory and the number of memory blocks the call allocated that were still
+live when it returned: mostly its result's. Startup cases
+run each repeat in a fresh interpreter, as a render worker would, and
+report its peak RSS instead.
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+import ACS2016
+
+
+# Columns per table in the 2017 ACS 5-year release.
+TABLE_SIZES = {
+    'B01001': 49, 'B03002': 21, 'B05006': 161, 'B07003': 18, 'B08006': 51,
+    'B11002': 12, 'B12001': 19, 'B13016': 9, 'B15002': 35, 'B16007': 19,
+    'B17001': 59, 'B19001': 17, 'B21002': 17, 'B25002': 3, 'B25003': 3,
+    'B25024': 11, 'B25026': 15, 'B25075': 27,
+}
+# Rows per containment query, by summary level: roughly California's.
+SUMLEVEL_ROWS = {'040': 52, '050': 58, '160': 1500, '310': 35}
+# All places nationwide, for the '160|01000US' case.
+NATIONWIDE_PLACES = 29500
+
+UPSTREAM_URL = 'https://api.censusreporter.org'
+
+
+def synthesize_response(release, table_ids, geo_ids, seed=0):
+    """Build a response body shaped like Census Reporter's."""
+    rng = random.Random(seed)
+    tables = {}
+    for table_id in table_ids:
+        n_columns = TABLE_SIZES.get(table_id, 50)
+        tables[table_id] = {
+            'title': table_id,
+            'universe': 'Total population',
+            'denominator_column_id': table_id + '001',
+            'columns': dict(
+                ('%s%03d' % (table_id, i), {
+                    'name': 'Total:' if i == 1 else 'Column %d' % i,
+                    'indent': 0 if i == 1 else 1 + (i % 2),
+                })
+                for i in range(1, n_columns + 1)
+            ),
+        }
+
+    data = {}
+    geography = {}
+    for geo_id in geo_ids:
+        sumlevel, _, parent = geo_id.partition('|')
+        if not parent:
+            geography[geo_id] = {'name': geo_id, 'sumlevel': geo_id[:3]}
+            continue
+        geography[parent] = {'name': 'Parent ' + parent,
+                             'sumlevel': parent[:3]}
+        if parent == '01000US' and sumlevel == '160':
+            n_rows = NATIONWIDE_PLACES
+        else:
+            n_rows = SUMLEVEL_ROWS.get(sumlevel, 50)
+        for i in range(n_rows):
+            geoid = '%s00US%s%05d' % (sumlevel, parent[7:], i)
+            geography[geoid] = {'name': 'Place %d, %s' % (i, parent),
+                                'sumlevel': sumlevel}
+
+    geoids = list(geography)[1:]
+    for geoid in geoids:
+        data[geoid] = {}
+        for table_id, table in tables.items():
+            estimate = {}
+            error = {}
+            for column_id in table['columns']:
+                estimate[column_id] = float(rng.randint(0, 100000))
+                error[column_id] = float(rng.randint(0, 5000))
+            data[geoid][table_id] = {'estimate': estimate, 'error': error}
+
+    return {
+        'release': {'id': release, 'name': 'ACS 2017 5-year',
+                    'years': '2013-2017'},
+        'tables': tables,
+        'data': data,
+        'geography': geography,
+    }
+
+
+class StandInServer:
+    """
+    Local HTTP server standing in for api.censusreporter.org.
+
+    `latency` seconds are slept before each response. With `fixtures_dir`,
+    a request whose recorded body is there is served from it; with
+    `record` too, other requests are fetched from the real API and saved.
+    """
+    def __init__(self, fixtures_dir=None, latency=0.0, record=False):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.record = record
+        self.bodies = {}
+        self.n_requests = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this,
+                # Nagle's algorithm adds ~40ms to every small response.
+                self.connection.setsockopt(socket.IPPROTO_TCP,
+                                           socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                body = server.respond(self.path)
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                     Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def api_url(self):
+        return ('http://127.0.0.1:%d/1.0/data/show/{release}'
+                '?table_ids={table_ids}&geo_ids={geoids}'
+                % self.httpd.server_port)
+
+    def respond(self, path):
+        parts = urllib.parse.urlsplit(path)
+        release = parts.path.rsplit('/', 1)[1]
+        query = urllib.parse.parse_qs(parts.query)
+        table_ids = query['table_ids'][0].split(',')
+        geo_ids = query['geo_ids'][0].split(',')
+        key = ACS2016._cache_key(table_ids, geo_ids, release)
+
+        with self.lock:
+            self.n_requests += 1
+            if key in self.bodies:
+                return self.bodies[key]
+
+        body = None
+        if self.fixtures_dir is not None:
+            fixture_path = os.path.join(self.fixtures_dir, key + '.json')
+            if os.path.exists(fixture_path):
+                with open(fixture_path, 'rb') as f:
+                    body = f.read()
+            elif self.record:
+                with urllib.request.urlopen(UPSTREAM_URL + path) as response:
+                    body = response.read()
+                os.makedirs(self.fixtures_dir, exist_ok=True)
+                with open(fixture_path, 'wb') as f:
+                    f.write(body)
+        if body is None:
+            response = synthesize_response(release, table_ids, geo_ids)
+            body = json.dumps(response).encode('utf-8')
+
+        with self.lock:
+            self.bodies[key] = body
+        return body
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def benchmark_cases(nationwide=False):
+    """Yield (name, fn) for every benchmarked call."""
+    for topic in ACS2016.TOPIC_TABLES:
+        for sumlevel in ('all_states', 'counties', 'places', 'metro_areas'):
+            params = {'topic': topic, 'sumlevel': sumlevel, 'statecode': 'ca'}
+            yield ('render %s %s' % (topic, sumlevel),
+                   lambda params=params: ACS2016.render(None, params))
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        pass  # render_arrow() needs it
+    else:
+        for topic in ACS2016.TOPIC_TABLES:
+            params = {'topic': topic, 'sumlevel': 'places', 'statecode': 'ca'}
+            yield ('render_arrow %s places' % topic,
+                   lambda params=params: ACS2016.render_arrow(None, params))
+
+    for table_id in sorted(set(ACS2016.TOPIC_TABLES.values())):
+        yield ('get_dataframe %s places' % table_id,
+               lambda table_id=table_id: ACS2016.get_dataframe(
+                   table_id, '160|04000US06', geo_names=True, col_names=True
+               ))
+
+    if nationwide:
+        yield ('get_dataframe B05006 places nationwide',
+               lambda: ACS2016.get_dataframe('B05006', '160|01000US',
+                                             geo_names=True))
+        for topic in ('age', 'place_of_birth_for_foreign_born_population'):
+            yield ('get_dataframe_simple %s places nationwide' % topic,
+                   lambda topic=topic: ACS2016.get_dataframe_simple(
+                       topic, '160|01000US'
+                   ))
+
+
+# Run in a fresh interpreter per repeat: argv is [API URL, render params].
+STARTUP_SCRIPT = r'''
+import json, resource, sys, time
+
+def peak_kib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+start = time.perf_counter()
+import ACS2016
+imported = time.perf_counter()
+import_kib = peak_kib()
+ACS2016.migrate_params({'topic': 3, 'sumlevel': 1, 'states-for-counties': 4,
+                        'states-for-places': 4, 'states-for-metro-areas': 4})
+migrated = time.perf_counter()
+migrate_kib = peak_kib()
+heavy = [name for name in ('numpy', 'pandas') if name in sys.modules]
+
+ACS2016.API_URL = sys.argv[1]
+ACS2016.CACHE_DIR = None
+ACS2016.SNAPSHOT_DIR = None
+ACS2016.ROLLUP_DIR = None
+ACS2016.render(None, json.loads(sys.argv[2]))
+rendered = time.perf_counter()
+
+print(json.dumps({
+    'import': [imported - start, import_kib],
+    'migrate_params': [migrated - imported, migrate_kib],
+    'first render': [rendered - migrated, peak_kib()],
+    'heavy_imports_before_render': heavy,
+}))
+'''
+
+
+def run_startup_cases(api_url, repeat):
+    """
+    Time importing ACS2016, migrate_params() and the first render() in
+    `repeat` fresh interpreters. Return {name: result}, like run_case().
+    """
+    params = {'topic': 'household_income', 'sumlevel': 'counties',
+              'statecode': 'ca'}
+    command = [sys.executable, '-c', STARTUP_SCRIPT, api_url,
+               json.dumps(params)]
+    cwd = os.path.dirname(os.path.abspath(ACS2016.__file__))
+
+    runs = []
+    for i in range(repeat + 1):
+        output = subprocess.run(command, cwd=cwd, check=True,
+                                stdout=subprocess.PIPE).stdout
+        if i > 0:  # the first run warms the OS file cache and .pyc files
+            runs.append(json.loads(output))
+
+    heavy = sorted(set(name for run in runs
+                       for name in run.pop('heavy_imports_before_render')))
+    if heavy:
+        print('WARNING: imported %s before the first render'
+              % ', '.join(heavy))
+
+    results = {}
+    for name in runs[0]:
+        timings = sorted(run[name][0] for run in runs)
+        results['startup ' + name] = {
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p90_ms': percentile(timings, 0.90) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'peak_kib': max(run[name][1] for run in runs),
+            'blocks_allocated': 0,
+        }
+    return results
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run_case(fn, repeat):
+    fn()  # warm up: server-side body generation, imports, connections
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    # Only blocks allocated since start() are traced; `result`, still
+    # referenced here, holds most of those still live.
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks_allocated = sum(stat.count
+                           for stat in snapshot.statistics('filename'))
+
+    return {
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p90_ms': percentile(timings, 0.90) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'peak_kib': peak / 1024,
+        'blocks_allocated': blocks_allocated,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages, comparing to `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ('p50_ms', 'peak_kib'):
+            old = baseline[name][metric]
+            new = result[metric]
+            if old > 0 and new > old * (1 + threshold):
+                regressions.append('%s: %s %.1f -> %.1f (+%.0f%%)'
+                                   % (name, metric, old, new,
+                                      (new / old - 1) * 100))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the stand-in sleeps per request')
+    parser.add_argument('--fixtures', help='directory of recorded responses')
+    parser.add_argument('--record', action='store_true',
+                        help='fetch and save responses missing from --fixtures')
+    parser.add_argument('--nationwide', action='store_true',
+                        help='add all-places-nationwide cases (slow)')
+    parser.add_argument('--cache', action='store_true',
+                        help="leave ACS2016's response cache on")
+    parser.add_argument('--filter', default='',
+                        help='only run cases whose name contains this')
+    parser.add_argument('--startup', action='store_true',
+                        help='add cold-start cases: import, migrate_params() '
+                             'and first render(), each in a new process')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown vs. baseline (0.2 = 20%%)')
+    parser.add_argument('--save-baseline', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    if args.record and not args.fixtures:
+        parser.error('--record needs --fixtures')
+
+    results = {}
+    with StandInServer(args.fixtures, args.latency, args.record) as server:
+        ACS2016.API_URL = server.api_url
+        if not args.cache:
+            ACS2016.CACHE_DIR = None
+        ACS2016.SNAPSHOT_DIR = None
+        ACS2016.ROLLUP_DIR = None
+
+        print('%-70s %9s %9s %9s %10s %8s'
+              % ('case', 'p50 ms', 'p90 ms', 'p99 ms', 'peak KiB', 'blocks'))
+
+        def report(name, result):
+            results[name] = result
+            print('%-70s %9.2f %9.2f %9.2f %10.0f %8d'
+                  % (name, result['p50_ms'], result['p90_ms'],
+                     result['p99_ms'], result['peak_kib'],
+                     result['blocks_allocated']))
+
+        if args.startup:
+            for name, result in run_startup_cases(server.api_url,
+                                                  args.repeat).items():
+                if args.filter in name:
+                    report(name, result)
+        for name, fn in benchmark_cases(args.nationwide):
+            if args.filter not in name:
+                continue
+            report(name, run_case(fn, args.repeat))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for message in regressions:
+            print('REGRESSION ' + message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
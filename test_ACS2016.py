@@ -1,5 +1,106 @@
+import contextlib
+import gzip
+import http.server
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from ACS2016 import migrate_params
+import urllib.error
+import zlib
+from unittest import mock
+import ACS2016
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+from ACS2016 import get_data, get_dataframe_simple, get_dataframes_simple, \
+    get_dataframe, migrate_params, prep_columnar, prep_for_pandas, render
+
+
+RESPONSE = {
+    "tables": {
+        "B25003": {
+            "title": "Tenure",
+            "columns": {
+                "B25003001": {"name": "Total:", "indent": 0},
+                "B25003002": {"name": "Owner occupied", "indent": 1},
+                "B25003003": {"name": "Renter occupied", "indent": 1},
+            },
+        }
+    },
+    "data": {
+        "05000US02013": {
+            "B25003": {
+                "estimate": {"B25003001": 1000.0, "B25003002": 600.0,
+                             "B25003003": 400.0},
+                "error": {"B25003001": 30.0, "B25003002": 40.0,
+                          "B25003003": 20.0},
+            }
+        },
+        "05000US02016": {
+            "B25003": {
+                "estimate": {"B25003001": 2000.0, "B25003002": 500.0,
+                             "B25003003": 1500.0},
+                "error": {"B25003001": 50.0, "B25003002": 60.0,
+                          "B25003003": 70.0},
+            }
+        },
+    },
+    "geography": {
+        "04000US02": {"name": "Alaska"},
+        "05000US02013": {"name": "Aleutians East Borough, AK"},
+        "05000US02016": {"name": "Aleutians West Census Area, AK"},
+    },
+    "release": {"id": "acs2017_5yr", "years": "2013-2017"},
+}
+
+
+class FakeResponse(io.BytesIO):
+    """A 200 http.client.HTTPResponse with no headers."""
+    status = 200
+
+    def getheader(self, name, default=None):
+        return default
+
+
+def fake_http_open(body):
+    return lambda url, headers={}: contextlib.nullcontext(FakeResponse(body))
+
+
+def mock_http_open(response=RESPONSE):
+    """Patch ACS2016's HTTP client to return `response` as the body."""
+    body = json.dumps(response).encode('utf-8')
+    return mock.patch.object(
+        ACS2016, '_http_open',
+        side_effect=fake_http_open(body)
+    )
+
+
+class CachedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        for name, value in [('CACHE_DIR', self.tempdir.name),
+                            ('_table_metadata', {}),
+                            ('_table_metadata_loaded', set()),
+                            ('_circuit', ACS2016._CircuitBreaker())]:
+            patcher = mock.patch.object(ACS2016, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.tempdir.cleanup)
+        self.addCleanup(self.join_refreshes)
+
+    def join_refreshes(self):
+        """Wait for render()'s background cache refreshes."""
+        for thread in list(ACS2016._refreshes.values()):
+            thread.join()
 
 
 class MigrateParamsTest(unittest.TestCase):
@@ -55,6 +156,1040 @@ class MigrateParamsTest(unittest.TestCase):
             },
         )
 
+    def test_without_pandas(self):
+        # Render workers migrate params on a cold start: keep that fast
+        script = ('import sys, ACS2016\n'
+                  'ACS2016.migrate_params({"topic": 3, "sumlevel": 0, '
+                  '"states-for-counties": 2, "states-for-places": 4, '
+                  '"states-for-metro-areas": 23})\n'
+                  'print(sorted({"numpy", "pandas"} & set(sys.modules)))')
+        output = subprocess.check_output(
+            [sys.executable, '-c', script],
+            cwd=os.path.dirname(os.path.abspath(ACS2016.__file__))
+        )
+        self.assertEqual(output.strip(), b'[]')
+
+
+class GetDataCacheTest(CachedTestCase):
+    def test_repeat_request_served_from_cache(self):
+        with mock_http_open() as http_open:
+            first = get_data('B25003', '050|04000US02')
+            second = get_data('b25003', '050%7C04000US02')
+        self.assertEqual(http_open.call_count, 1)
+        self.assertEqual(first, RESPONSE)
+        self.assertEqual(second, RESPONSE)
+
+    def test_expired_entry_is_refetched(self):
+        with mock_http_open() as http_open:
+            get_data('B25003', '050|04000US02')
+            for name in os.listdir(self.tempdir.name):
+                path = os.path.join(self.tempdir.name, name)
+                old = time.time() - ACS2016.CACHE_TTL['latest'] - 1
+                os.utime(path, (old, old))
+            get_data('B25003', '050|04000US02')
+        self.assertEqual(http_open.call_count, 2)
+
+    def test_named_release_never_expires(self):
+        with mock_http_open() as http_open:
+            get_data('B25003', '050|04000US02', release='acs2016_5yr')
+            for name in os.listdir(self.tempdir.name):
+                os.utime(os.path.join(self.tempdir.name, name), (0, 0))
+            get_data('B25003', '050|04000US02', release='acs2016_5yr')
+        self.assertEqual(http_open.call_count, 1)
+
+    def test_offline_miss(self):
+        with mock_http_open() as http_open:
+            with self.assertRaises(LookupError):
+                get_data('B25003', '050|04000US02', offline=True)
+        http_open.assert_not_called()
+
+    def test_evict_least_recently_used(self):
+        with mock_http_open():
+            get_data('B25003', '050|04000US01')
+            get_data('B25003', '050|04000US02')
+            (size,) = set(os.path.getsize(os.path.join(self.tempdir.name, n))
+                          for n in os.listdir(self.tempdir.name))
+            get_data('B25003', '050|04000US01')  # bump to most-recent
+            with mock.patch.object(ACS2016, 'CACHE_MAX_BYTES', size * 2):
+                get_data('B25003', '050|04000US04')
+
+        with mock_http_open() as http_open:
+            get_data('B25003', '050|04000US01', offline=True)
+            get_data('B25003', '050|04000US04', offline=True)
+            with self.assertRaises(LookupError):
+                get_data('B25003', '050|04000US02', offline=True)
+
+    def test_evict_abandoned_temporary_files(self):
+        old = os.path.join(self.tempdir.name, 'old.tmp')
+        new = os.path.join(self.tempdir.name, 'new.tmp')
+        for path in (old, new):
+            open(path, 'wb').close()
+        os.utime(old, (0, 0))
+        with mock_http_open():
+            get_data('B25003', '050|04000US02')
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+
+class PrepColumnarTest(unittest.TestCase):
+    def test_matches_prep_for_pandas(self):
+        response = json.loads(json.dumps(RESPONSE))
+        response['data']['05000US02016']['B25003']['estimate'] = {
+            # different key order, and a null
+            'B25003003': 1500.0, 'B25003001': None, 'B25003002': 500.0,
+        }
+        for include_moe in (False, True):
+            expected = pd.DataFrame.from_dict(
+                prep_for_pandas(response['data'], include_moe),
+                orient='index'
+            )
+            expected = expected[sorted(expected.columns)]
+            assert_frame_equal(prep_columnar(response, include_moe),
+                               expected)
+
+
+class StreamingDecodeTest(CachedTestCase):
+    def test_parse_in_tiny_chunks(self):
+        # 'data' before 'tables', so rows must wait for the column list
+        response = {
+            'data': RESPONSE['data'],
+            'release': {'id': 'acs2017_5yr', 'years': [2013, 2.5e3, None]},
+            'geography': RESPONSE['geography'],
+            'tables': RESPONSE['tables'],
+        }
+        body = json.dumps(response, indent=1).encode('utf-8')
+        with mock.patch.object(ACS2016, 'READ_CHUNK_SIZE', 3):
+            result = ACS2016._read_columnar(io.BytesIO(body), True)
+        assert_frame_equal(result.data, prep_columnar(response, True))
+        self.assertEqual(result.geography, RESPONSE['geography'])
+        self.assertEqual(result.tables, RESPONSE['tables'])
+
+    def test_get_dataframe_caches_streamed_body(self):
+        with mock_http_open() as http_open:
+            result = get_dataframe('B25003', '050|04000US02', geo_names=True)
+        self.assertEqual(list(result.columns),
+                         ['name', 'geoid', 'B25003001', 'B25003002',
+                          'B25003003'])
+        self.assertEqual(get_data('B25003', '050|04000US02', offline=True),
+                         RESPONSE)
+
+    def test_truncated_body_is_not_cached(self):
+        body = json.dumps(RESPONSE).encode('utf-8')[:-20]
+        with mock.patch.object(
+            ACS2016, '_http_open',
+            side_effect=fake_http_open(body)
+        ):
+            with self.assertRaises(ValueError):
+                get_dataframe('B25003', '050|04000US02')
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+
+
+class SnapshotTest(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.snapshot_dir = os.path.join(self.tempdir.name, 'snapshot')
+        with mock_http_open() as http_open:
+            ACS2016.ingest_snapshot(self.snapshot_dir, ['B25003'])
+        self.assertEqual(http_open.call_count,
+                         1 + 3 * len(ACS2016.STATE_FIPS))
+        patcher = mock.patch.object(ACS2016, 'SNAPSHOT_DIR',
+                                    self.snapshot_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render_from_snapshot(self):
+        with mock_http_open() as http_open:
+            ACS2016.SNAPSHOT_DIR = None
+            expected = render(None, {'topic': 'ownership_of_occupied_units',
+                                     'sumlevel': 'places',
+                                     'statecode': 'ak'})
+            ACS2016.SNAPSHOT_DIR = self.snapshot_dir
+            http_open.reset_mock()
+            result = render(None, {'topic': 'ownership_of_occupied_units',
+                                   'sumlevel': 'places',
+                                   'statecode': 'ak'})
+        http_open.assert_not_called()
+        assert_frame_equal(result, expected)
+
+    def test_get_dataframe_with_moe(self):
+        with mock_http_open() as http_open:
+            result = get_dataframe('B25003', '050|04000US02', geo_names=True,
+                                   include_moe=True)
+        http_open.assert_not_called()
+        self.assertEqual(list(result.columns)[:4],
+                         ['name', 'geoid', 'B25003001', 'B25003001_moe'])
+        self.assertEqual(list(result['B25003002_moe']), [40.0, 60.0])
+
+    def test_get_dataframe_compact(self):
+        with mock_http_open():
+            expected = get_dataframe('B25003', '050|04000US02',
+                                     geo_names=True, col_names=True,
+                                     include_moe=True)
+            result = get_dataframe('B25003', '050|04000US02',
+                                   geo_names=True, col_names=True,
+                                   include_moe=True, compact=True)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(str(result.iloc[:, 2].dtype), 'Int32')
+        assert_frame_equal(result, expected, check_dtype=False,
+                           check_categorical=False)
+
+    def test_missing_table_falls_back_to_api(self):
+        with mock_http_open() as http_open:
+            get_dataframe('B25002', '050|04000US02')
+        self.assertEqual(http_open.call_count, 1)
+
+    def test_reingest_replaces_loaded_table(self):
+        get_dataframe('B25003', '050|04000US02')
+        response = json.loads(json.dumps(RESPONSE))
+        response['data']['05000US02013']['B25003']['estimate']['B25003002'] \
+            = 700.0
+        with mock.patch.object(ACS2016, 'CACHE_DIR', None), \
+                mock_http_open(response):
+            ACS2016.ingest_snapshot(self.snapshot_dir, ['B25003'])
+        meta_path = os.path.join(self.snapshot_dir, 'B25003', 'meta.json')
+        os.utime(meta_path, (time.time() + 1, time.time() + 1))
+
+        result = get_dataframe('B25003', '050|04000US02')
+        self.assertEqual(list(result['B25003002']), [700.0, 500.0])
+        self.assertEqual([path for path in ACS2016._snapshot_tables
+                          if path.startswith(self.snapshot_dir)],
+                         [os.path.dirname(meta_path)])
+
+
+class RollupTest(CachedTestCase):
+    TOPIC = 'ownership_of_occupied_units'
+
+    def setUp(self):
+        super().setUp()
+        self.rollup_dir = os.path.join(self.tempdir.name, 'rollups')
+        with mock_http_open() as http_open:
+            ACS2016.precompute_rollups(self.rollup_dir, [self.TOPIC])
+        self.assertEqual(http_open.call_count,
+                         1 + 3 * len(ACS2016.STATE_FIPS))
+        patcher = mock.patch.object(ACS2016, 'ROLLUP_DIR', self.rollup_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_render_from_rollup(self, params):
+        with mock_http_open() as http_open:
+            ACS2016.ROLLUP_DIR = None
+            expected = render(None, params)
+            ACS2016.ROLLUP_DIR = self.rollup_dir
+            http_open.reset_mock()
+            result = render(None, params)
+        http_open.assert_not_called()
+        assert_frame_equal(result, expected)
+
+    def test_render_from_rollup(self):
+        self.assert_render_from_rollup({'topic': self.TOPIC,
+                                        'sumlevel': 'places',
+                                        'statecode': 'ak'})
+
+    def test_render_all_states_from_rollup(self):
+        self.assert_render_from_rollup({'topic': self.TOPIC,
+                                        'sumlevel': 'all_states',
+                                        'statecode': 'ak'})
+        self.assert_render_from_rollup({'topic': self.TOPIC,
+                                        'sumlevel': 'counties',
+                                        'statecode': 'all'})
+
+    def test_stale_rollup_falls_back_to_live(self):
+        with mock.patch.object(ACS2016, 'CACHE_TTL', {'latest': 0}):
+            with mock_http_open() as http_open:
+                render(None, {'topic': self.TOPIC, 'sumlevel': 'places',
+                              'statecode': 'ak'})
+                self.join_refreshes()
+        # Live: the (also expired) cached response, refreshed
+        self.assertEqual(http_open.call_count, 1)
+
+    def test_new_release_makes_rollup_stale(self):
+        response = json.loads(json.dumps(RESPONSE))
+        response['release']['id'] = 'acs2018_5yr'
+        for name in os.listdir(self.tempdir.name):
+            os.utime(os.path.join(self.tempdir.name, name), (0, 0))
+        with mock_http_open(response):
+            get_dataframe_simple(self.TOPIC, '160|04000US02')
+        self.assertIsNone(ACS2016._rollup_frame(self.TOPIC, 'places', 'ak'))
+
+    def test_current_release_rollup_outlives_ttl(self):
+        path = os.path.join(self.rollup_dir, self.TOPIC, 'meta.json')
+        with open(path) as f:
+            meta = json.load(f)
+        self.assertEqual(meta['release_id'], 'acs2017_5yr')
+        meta['created'] = 0
+        with open(path, 'w') as f:
+            json.dump(meta, f)
+        self.assertIsNotNone(ACS2016._rollup_frame(self.TOPIC, 'places',
+                                                   'ak'))
+
+    def test_precompute_again_replaces_loaded_topic(self):
+        ACS2016._rollup_frame(self.TOPIC, 'places', 'ak')
+        with mock_http_open():
+            ACS2016.precompute_rollups(self.rollup_dir, [self.TOPIC])
+        meta_path = os.path.join(self.rollup_dir, self.TOPIC, 'meta.json')
+        os.utime(meta_path, (time.time() + 1, time.time() + 1))
+        ACS2016._rollup_frame(self.TOPIC, 'places', 'ak')
+        self.assertEqual([path for path in ACS2016._rollup_topics
+                          if path.startswith(self.rollup_dir)],
+                         [os.path.dirname(meta_path)])
+
+    def test_missing_topic_falls_back_to_live(self):
+        with mock_http_open() as http_open:
+            render(None, {'topic': 'occupied_vs_vacant_housing',
+                          'sumlevel': 'places', 'statecode': 'ak'})
+        self.assertEqual(http_open.call_count, 1)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_render_arrow_from_rollup(self):
+        params = {'topic': self.TOPIC, 'sumlevel': 'places',
+                  'statecode': 'ak'}
+        with mock_http_open() as http_open:
+            result = ACS2016.render_arrow(None, params)
+            expected = render(None, params)
+        http_open.assert_not_called()
+        assert_frame_equal(result.to_pandas(), expected,
+                           check_dtype=False)
+
+
+class RenderArrowWithoutPyarrowTest(CachedTestCase):
+    def test_fails_before_fetching(self):
+        with mock.patch.dict(sys.modules, {'pyarrow': None}), \
+                mock.patch.object(ACS2016, 'pa', ACS2016.pa), \
+                mock_http_open() as http_open:
+            with self.assertRaises(ImportError):
+                ACS2016.render_arrow(None, {
+                    'topic': 'ownership_of_occupied_units',
+                    'sumlevel': 'counties', 'statecode': 'ak'
+                })
+        http_open.assert_not_called()
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class RenderArrowTest(CachedTestCase):
+    def assert_matches_render(self, params, response=RESPONSE):
+        with mock_http_open(response):
+            result = ACS2016.render_arrow(None, params)
+            expected = render(None, params)
+        self.assertIsInstance(result, pyarrow.Table)
+        assert_frame_equal(result.to_pandas(), expected, check_dtype=False)
+        return result
+
+    def test_render_arrow(self):
+        response = json.loads(json.dumps(RESPONSE))
+        estimate = response['data']['05000US02013']['B25003']['estimate']
+        estimate['B25003002'] = None
+        result = self.assert_matches_render(
+            {'topic': 'ownership_of_occupied_units', 'sumlevel': 'counties',
+             'statecode': 'ak'},
+            response
+        )
+        self.assertEqual(result.column('Owner Occupied').null_count, 1)
+
+    def test_render_arrow_all_states(self):
+        self.assert_matches_render({'topic': 'ownership_of_occupied_units',
+                                    'sumlevel': 'metro_areas',
+                                    'statecode': 'all'})
+
+    def test_get_table_simple_with_moe(self):
+        with mock_http_open():
+            result = ACS2016.get_table_simple('ownership_of_occupied_units',
+                                              '050|04000US02',
+                                              include_moe=True)
+            expected = get_dataframe_simple('ownership_of_occupied_units',
+                                            '050|04000US02',
+                                            include_moe=True)
+        assert_frame_equal(result.to_pandas(), expected, check_dtype=False)
+
+
+class TableMetadataTest(CachedTestCase):
+    def test_col_names(self):
+        response = json.loads(json.dumps(RESPONSE))
+        response['tables']['B25003']['columns']['B25003004'] = {
+            'name': 'With a mortgage', 'indent': 2,
+        }
+        with mock_http_open(response):
+            result = get_dataframe('B25003', '050|04000US02', col_names=True)
+        self.assertEqual(list(result.columns), [
+            'Total:', 'geoid', 'Owner occupied', 'Renter occupied',
+            'Renter occupied With a mortgage',
+        ])
+        metadata = ACS2016.table_metadata('b25003')
+        self.assertEqual(metadata.column_ids, ['B25003001', 'B25003002',
+                                               'B25003003', 'B25003004'])
+        self.assertEqual(metadata.parents, {
+            'B25003001': None,
+            'B25003002': 'B25003001',
+            'B25003003': 'B25003001',
+            'B25003004': 'B25003003',
+        })
+
+    def test_persisted_per_release(self):
+        with mock_http_open():
+            get_dataframe('B25003', '050|04000US02', release='acs2017_5yr')
+        ACS2016._table_metadata.clear()
+        ACS2016._table_metadata_loaded.clear()
+        with mock_http_open() as http_open:
+            metadata = ACS2016.table_metadata('B25003', 'acs2017_5yr')
+        http_open.assert_not_called()
+        self.assertEqual(metadata.names['B25003002'], 'Owner occupied')
+
+
+class InstrumentationTest(CachedTestCase):
+    PARAMS = {'topic': 'ownership_of_occupied_units', 'sumlevel': 'counties',
+              'statecode': 'ak'}
+
+    def test_render_stages(self):
+        events = []
+        with ACS2016.instrumented(events.append):
+            with mock_http_open():
+                render(None, self.PARAMS)
+                render(None, self.PARAMS)
+        self.assertEqual([event['stage'] for event in events], [
+            'cache', 'parse', 'curate', 'render',
+            'cache', 'parse', 'curate', 'render',
+        ])
+        self.assertEqual([events[0]['hit'], events[4]['hit']], [False, True])
+        parse = events[1]
+        self.assertEqual(parse['bytes'], len(json.dumps(RESPONSE)))
+        self.assertEqual((parse['rows'], parse['columns']), (2, 3))
+        self.assertGreaterEqual(parse['seconds'], parse['read_seconds'])
+        self.assertEqual(events[3]['topic'], 'ownership_of_occupied_units')
+        self.assertEqual((events[3]['rows'], events[3]['columns']), (2, 4))
+        self.assertIsNone(ACS2016._instrumentation)
+
+    def test_log_instrumentation(self):
+        with ACS2016.instrumented(ACS2016.log_instrumentation):
+            with self.assertLogs('ACS2016.instrumentation') as logs:
+                with mock_http_open():
+                    render(None, self.PARAMS)
+        event = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(event['stage'], 'render')
+        self.assertEqual(event['statecode'], 'ak')
+
+
+class HttpTest(CachedTestCase):
+    """Exercise the real HTTP client against a local keep-alive server."""
+    def setUp(self):
+        super().setUp()
+        body = json.dumps(RESPONSE).encode('utf-8')
+        self.requests = []  # (client address, request headers, status)
+        self.encoding = 'gzip'  # what the server sends when accepted
+        self.delay = 0  # seconds before responding
+        self.trickle = 0  # seconds between body bytes
+        test = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                time.sleep(test.delay)
+                if self.headers.get('If-None-Match') == '"v1"':
+                    test.requests.append((self.client_address, self.headers,
+                                          304))
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                test.requests.append((self.client_address, self.headers, 200))
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                data = body
+                if test.encoding in self.headers.get('Accept-Encoding', ''):
+                    if test.encoding == 'gzip':
+                        data = gzip.compress(body)
+                    else:
+                        data = zlib.compress(body)
+                    self.send_header('Content-Encoding', test.encoding)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if not test.trickle:
+                    self.wfile.write(data)
+                    return
+                try:
+                    for i in range(len(data)):
+                        self.wfile.write(data[i:i + 1])
+                        self.wfile.flush()
+                        time.sleep(test.trickle)
+                except OSError:
+                    pass  # the client gave up
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        patcher = mock.patch.object(
+            ACS2016, 'API_URL',
+            'http://127.0.0.1:%d/{release}?table_ids={table_ids}'
+            '&geo_ids={geoids}' % server.server_port
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expire_cache(self):
+        for name in os.listdir(self.tempdir.name):
+            os.utime(os.path.join(self.tempdir.name, name), (0, 0))
+
+    def test_reuse_connection(self):
+        self.assertEqual(get_data('B25003', '050|04000US01'), RESPONSE)
+        result = get_dataframe('B25003', '050|04000US02')
+        self.assertEqual(list(result['B25003002']), [600.0, 500.0])
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(len(set(r[0] for r in self.requests)), 1)
+
+    def test_reuse_connection_after_revalidation(self):
+        get_data('B25003', '050|04000US01')
+        get_data('B25003', '050|04000US02')
+        self.expire_cache()
+        get_data('B25003', '050|04000US01')
+        get_data('B25003', '050|04000US02')
+        self.assertEqual([r[2] for r in self.requests], [200, 200, 304, 304])
+        self.assertEqual(len(set(r[0] for r in self.requests)), 1)
+
+    def test_reuse_connections_across_fan_outs(self):
+        with mock.patch.object(ACS2016, '_executor', None), \
+                mock.patch.object(ACS2016, 'MAX_CONCURRENT_REQUESTS', 2):
+            for geoids in (['050|04000US01', '050|04000US02'],
+                           ['050|04000US04', '050|04000US05']):
+                ACS2016._map_concurrently(
+                    lambda geoid: get_data('B25003', geoid), geoids
+                )
+            ACS2016._executor.shutdown()
+        self.assertEqual(len(self.requests), 4)
+        self.assertLessEqual(len(set(r[0] for r in self.requests)), 2)
+
+    def test_entry_evicted_during_revalidation(self):
+        get_data('B25003', '050|04000US02')
+        self.expire_cache()
+        # As if evicted between sending If-None-Match and the 304
+        with mock.patch.object(ACS2016, '_cache_open', return_value=None):
+            result = get_dataframe('B25003', '050|04000US02')
+        self.assertEqual(list(result['B25003002']), [600.0, 500.0])
+        self.assertEqual([r[2] for r in self.requests], [200, 304, 200])
+        self.assertNotIn('If-None-Match', self.requests[2][1])
+
+    def test_body_cached_before_validators(self):
+        # Else dying in between would pair the old body with the new ETag
+        with mock.patch.object(ACS2016.os, 'replace',
+                               wraps=os.replace) as replace:
+            get_data('B25003', '050|04000US02')
+        self.assertEqual([os.path.basename(call.args[1]).split('.', 1)[1]
+                          for call in replace.call_args_list],
+                         ['json.gz', 'validators.json'])
+
+    def test_gzip_stored_as_sent(self):
+        self.assertEqual(get_data('B25003', '050|04000US02'), RESPONSE)
+        self.assertEqual(self.requests[0][1]['Accept-Encoding'],
+                         'gzip, deflate')
+        self.assertEqual(get_data('B25003', '050|04000US02', offline=True),
+                         RESPONSE)
+
+    def test_deflate(self):
+        self.encoding = 'deflate'
+        result = get_dataframe('B25003', '050|04000US02')
+        self.assertEqual(list(result['B25003003']), [400.0, 1500.0])
+        self.assertEqual(get_data('B25003', '050|04000US02', offline=True),
+                         RESPONSE)
+
+    def test_revalidate_expired_entry(self):
+        get_data('B25003', '050|04000US02')
+        self.expire_cache()
+        events = []
+        with ACS2016.instrumented(events.append):
+            result = get_dataframe('B25003', '050|04000US02')
+        self.assertEqual(list(result['B25003002']), [600.0, 500.0])
+        self.assertEqual([r[2] for r in self.requests], [200, 304])
+        self.assertEqual(self.requests[1][1]['If-None-Match'], '"v1"')
+        self.assertIn({'stage': 'revalidate', 'modified': False, 'hit': True},
+                      events)
+
+        # The 304 restarted the TTL
+        get_data('B25003', '050|04000US02')
+        self.assertEqual(len(self.requests), 2)
+
+    def test_timeout(self):
+        self.delay = 1
+        with mock.patch.object(ACS2016, 'REQUEST_TIMEOUT', 0.05), \
+                mock.patch.object(ACS2016, 'MAX_RETRIES', 0):
+            start = time.monotonic()
+            with self.assertRaises(OSError):
+                get_data('B25003', '050|04000US02')
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_deadline_cuts_off_trickling_body(self):
+        self.trickle = 0.02  # each read is well within REQUEST_TIMEOUT
+        with mock.patch.object(ACS2016, 'REQUEST_TIMEOUT', 0.2), \
+                mock.patch.object(ACS2016, 'REQUEST_DEADLINE', 0.5), \
+                mock.patch.object(ACS2016, 'MAX_RETRIES', 0):
+            start = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                ACS2016.get_columnar('B25003', '050|04000US02')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+
+
+class ResilienceTest(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ACS2016, 'RETRY_BACKOFF', 0.001)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def failing_http_open(self, *errors):
+        """Mock _http_open raising each of `errors`, then succeeding."""
+        body = json.dumps(RESPONSE).encode('utf-8')
+        errors = list(errors)
+
+        def http_open(url, headers={}):
+            if errors:
+                raise errors.pop(0)
+            return contextlib.nullcontext(FakeResponse(body))
+        return mock.patch.object(ACS2016, '_http_open', side_effect=http_open)
+
+    def http_error(self, code):
+        return urllib.error.HTTPError('url', code, 'Error', {}, None)
+
+    def test_retry_transient_errors(self):
+        with self.failing_http_open(ConnectionResetError(),
+                                    self.http_error(503)) as http_open:
+            self.assertEqual(get_data('B25003', '050|04000US02'), RESPONSE)
+        self.assertEqual(http_open.call_count, 3)
+
+    def test_client_error_not_retried(self):
+        with self.failing_http_open(self.http_error(404)) as http_open:
+            with self.assertRaises(urllib.error.HTTPError):
+                get_data('B25003', '050|04000US02')
+        self.assertEqual(http_open.call_count, 1)
+
+    def test_circuit_breaker(self):
+        with mock.patch.object(ACS2016, 'MAX_RETRIES', 0), \
+                mock.patch.object(ACS2016, 'CIRCUIT_FAILURE_THRESHOLD', 2):
+            with self.failing_http_open(ConnectionResetError(),
+                                        ConnectionResetError()) as http_open:
+                for _ in range(2):
+                    with self.assertRaises(ConnectionResetError):
+                        get_data('B25003', '050|04000US02')
+                with self.assertRaises(ACS2016.CircuitOpenError):
+                    get_data('B25003', '050|04000US02')
+                self.assertEqual(http_open.call_count, 2)
+
+                # After CIRCUIT_RESET_SECONDS, a trial request closes it
+                with mock.patch.object(ACS2016, 'CIRCUIT_RESET_SECONDS', 0):
+                    get_data('B25003', '050|04000US02')
+                get_data('B25003', '050|04000US01')
+                self.assertEqual(http_open.call_count, 4)
+
+    def test_circuit_breaker_client_error_trial(self):
+        # A 4xx means the API is up: it closes the circuit
+        with mock.patch.object(ACS2016, 'MAX_RETRIES', 0), \
+                mock.patch.object(ACS2016, 'CIRCUIT_FAILURE_THRESHOLD', 1), \
+                mock.patch.object(ACS2016, 'CIRCUIT_RESET_SECONDS', 3600):
+            with self.failing_http_open(ConnectionResetError(),
+                                        self.http_error(404)) as http_open:
+                with self.assertRaises(ConnectionResetError):
+                    get_data('B25003', '050|04000US02')
+                with mock.patch.object(ACS2016, 'CIRCUIT_RESET_SECONDS', 0):
+                    with self.assertRaises(urllib.error.HTTPError):
+                        get_data('B25003', '050|04000US02')
+                self.assertEqual(get_data('B25003', '050|04000US02'),
+                                 RESPONSE)
+                self.assertEqual(http_open.call_count, 3)
+
+    def test_circuit_breaker_trial_without_verdict(self):
+        # A trial that ends some other way lets the next one through
+        with mock.patch.object(ACS2016, 'MAX_RETRIES', 0), \
+                mock.patch.object(ACS2016, 'CIRCUIT_FAILURE_THRESHOLD', 1), \
+                mock.patch.object(ACS2016, 'CIRCUIT_RESET_SECONDS', 0):
+            with self.failing_http_open(ConnectionResetError(),
+                                        ValueError()) as http_open:
+                with self.assertRaises(ConnectionResetError):
+                    get_data('B25003', '050|04000US02')
+                with self.assertRaises(ValueError):
+                    get_data('B25003', '050|04000US02')
+                self.assertEqual(get_data('B25003', '050|04000US02'),
+                                 RESPONSE)
+                self.assertEqual(http_open.call_count, 3)
+
+    def test_render_serves_stale_and_refreshes(self):
+        params = {'topic': 'ownership_of_occupied_units',
+                  'sumlevel': 'counties', 'statecode': 'ak'}
+        with mock_http_open():
+            render(None, params)
+        for name in os.listdir(self.tempdir.name):
+            os.utime(os.path.join(self.tempdir.name, name), (0, 0))
+
+        response = json.loads(json.dumps(RESPONSE))
+        response['data']['05000US02013']['B25003']['estimate']['B25003002'] \
+            = 700.0
+        with mock_http_open(response) as http_open:
+            stale = render(None, params)
+            self.join_refreshes()
+            self.assertEqual(http_open.call_count, 1)
+            fresh = render(None, params)
+            self.assertEqual(http_open.call_count, 1)
+        self.assertEqual(list(stale['Owner Occupied']), [600.0, 500.0])
+        self.assertEqual(list(fresh['Owner Occupied']), [700.0, 500.0])
+
+    def test_refresh_finishes_before_exit(self):
+        # Render workers exit right after rendering
+        with mock_http_open():
+            get_data('B25003', '050|04000US02')
+        (name,) = os.listdir(self.tempdir.name)
+        path = os.path.join(self.tempdir.name, name)
+        os.utime(path, (0, 0))
+
+        script = ('import contextlib, io, sys, time, ACS2016\n'
+                  'ACS2016.CACHE_DIR = sys.argv[1]\n'
+                  'body = sys.stdin.buffer.read()\n'
+                  'class Response(io.BytesIO):\n'
+                  '    status = 200\n'
+                  '    def getheader(self, name, default=None):\n'
+                  '        return default\n'
+                  '@contextlib.contextmanager\n'
+                  'def http_open(url, headers=None):\n'
+                  '    time.sleep(0.5)\n'
+                  '    yield Response(body)\n'
+                  'ACS2016._http_open = http_open\n'
+                  'ACS2016.get_data("B25003", "050|04000US02",\n'
+                  '                 stale_while_revalidate=True)\n')
+        subprocess.run(
+            [sys.executable, '-c', script, self.tempdir.name],
+            input=json.dumps(RESPONSE).encode('utf-8'), check=True,
+            cwd=os.path.dirname(os.path.abspath(ACS2016.__file__))
+        )
+        self.assertEqual(os.listdir(self.tempdir.name), [name])
+        self.assertGreater(os.path.getmtime(path), 0)
+
+
+class GetDataframeSimpleTest(CachedTestCase):
+    def test_curate_columns(self):
+        with mock_http_open():
+            result = get_dataframe_simple('ownership_of_occupied_units',
+                                          '050|04000US02')
+        assert_frame_equal(result, pd.DataFrame({
+            'name': ['Aleutians East Borough, AK',
+                     'Aleutians West Census Area, AK'],
+            'geoid': ['05000US02013', '05000US02016'],
+            'Owner Occupied': [600.0, 500.0],
+            'Renter Occupied': [400.0, 1500.0],
+        }))
+
+    def test_sum_propagates_only_its_own_nulls(self):
+        response = json.loads(json.dumps(RESPONSE))
+        estimate = response['data']['05000US02013']['B25003']['estimate']
+        estimate['B25003002'] = None
+        with mock.patch.dict(ACS2016.TOPIC_AGGREGATIONS, {
+            'ownership_of_occupied_units': ACS2016._compile_topic_columns(
+                {'t': [('A', ['B25003002', 'B25003003']),
+                       ('B', ['B25003003'])]},
+                {'t': 'B25003'},
+            )['t'],
+        }):
+            with mock_http_open(response):
+                result = get_dataframe_simple('ownership_of_occupied_units',
+                                              '050|04000US02')
+        self.assertTrue(np.isnan(result['A'][0]))
+        self.assertEqual(list(result['A'][1:]), [2000.0])
+        self.assertEqual(list(result['B']), [400.0, 1500.0])
+
+    def test_include_moe(self):
+        with mock.patch.dict(ACS2016.TOPIC_AGGREGATIONS, {
+            'ownership_of_occupied_units': ACS2016._compile_topic_columns(
+                {'t': [('All', ['B25003002', 'B25003003']),
+                       ('Owner', ['B25003002'])]},
+                {'t': 'B25003'},
+            )['t'],
+        }):
+            with mock_http_open():
+                result = get_dataframe_simple('ownership_of_occupied_units',
+                                              '050|04000US02',
+                                              include_moe=True)
+        self.assertEqual(list(result.columns),
+                         ['name', 'geoid', 'All', 'All_moe', 'Owner',
+                          'Owner_moe'])
+        np.testing.assert_allclose(result['All_moe'],
+                                   [(40 ** 2 + 20 ** 2) ** 0.5,
+                                    (60 ** 2 + 70 ** 2) ** 0.5])
+        self.assertEqual(list(result['Owner_moe']), [40.0, 60.0])
+
+    def test_compact(self):
+        response = json.loads(json.dumps(RESPONSE))
+        estimate = response['data']['05000US02013']['B25003']['estimate']
+        estimate['B25003002'] = None
+        estimate['B25003003'] = 400.5
+        with mock_http_open(response):
+            result = get_dataframe_simple('ownership_of_occupied_units',
+                                          '050|04000US02', compact=True)
+        self.assertEqual(list(result.dtypes.astype(str))[2:],
+                         ['Int32', 'float64'])
+        self.assertIs(result['Owner Occupied'][0], pd.NA)
+        self.assertEqual(list(result['Owner Occupied'][1:]), [500])
+        self.assertEqual(list(result['Renter Occupied']), [400.5, 1500.0])
+        self.assertEqual(list(result['geoid']),
+                         ['05000US02013', '05000US02016'])
+
+    def test_compact_beyond_int32(self):
+        # e.g. aggregate dollars
+        response = json.loads(json.dumps(RESPONSE))
+        estimate = response['data']['05000US02013']['B25003']['estimate']
+        estimate['B25003003'] = 1e12
+        with mock_http_open(response), np.errstate(all='raise'):
+            result = get_dataframe_simple('ownership_of_occupied_units',
+                                          '050|04000US02', compact=True)
+        self.assertEqual(list(result.dtypes.astype(str))[2:],
+                         ['Int32', 'float64'])
+        self.assertEqual(list(result['Renter Occupied']), [1e12, 1500.0])
+
+    def test_spec_rejects_column_from_other_table(self):
+        with self.assertRaises(ValueError):
+            ACS2016._compile_topic_columns({'t': [('A', ['B01001002'])]},
+                                           {'t': 'B25003'})
+
+    def test_spec_matches_topic_tables(self):
+        self.assertEqual(set(ACS2016.TOPIC_AGGREGATIONS),
+                         set(ACS2016.TOPIC_TABLES))
+
+
+class GetDataframesSimpleTest(CachedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.response = json.loads(json.dumps(RESPONSE))
+        self.response['tables']['B25002'] = {
+            'title': 'Occupancy Status',
+            'columns': {
+                'B25002001': {'name': 'Total:', 'indent': 0},
+                'B25002002': {'name': 'Occupied', 'indent': 1},
+                'B25002003': {'name': 'Vacant', 'indent': 1},
+            },
+        }
+        for geoid, vacant in [('05000US02013', 100.0), ('05000US02016', 0.0)]:
+            self.response['data'][geoid]['B25002'] = {
+                'estimate': {'B25002002': 1000.0, 'B25002003': vacant},
+            }
+
+    def test_one_request_for_shared_tables(self):
+        topics = ['ownership_of_occupied_units', 'occupied_vs_vacant_housing',
+                  'ownership_of_occupied_units']
+        with mock_http_open(self.response) as http_open:
+            result = get_dataframes_simple(topics, '050|04000US02')
+            self.assertEqual(http_open.call_count, 1)
+            self.assertIn('table_ids=B25003,B25002&', http_open.call_args[0][0])
+            expected = get_dataframe_simple('ownership_of_occupied_units',
+                                            '050|04000US02')
+        assert_frame_equal(result['ownership_of_occupied_units'], expected)
+        self.assertEqual(list(result['occupied_vs_vacant_housing']['Vacant']),
+                         [100.0, 0.0])
+
+    def test_wide(self):
+        with mock_http_open(self.response):
+            result = get_dataframes_simple(
+                ['ownership_of_occupied_units', 'occupied_vs_vacant_housing'],
+                '050|04000US02',
+                wide=True
+            )
+        self.assertEqual(list(result.columns), [
+            'name', 'geoid',
+            'ownership_of_occupied_units: Owner Occupied',
+            'ownership_of_occupied_units: Renter Occupied',
+            'occupied_vs_vacant_housing: Occupied',
+            'occupied_vs_vacant_housing: Vacant',
+        ])
+        self.assertEqual(list(result['geoid']),
+                         ['05000US02013', '05000US02016'])
+
+
+class PanelTest(CachedTestCase):
+    def http_open(self, url, headers={}):
+        release = url.split('/show/')[1].split('?')[0]
+        response = json.loads(json.dumps(RESPONSE))
+        response['release']['id'] = release
+        if release == 'acs2016_5yr':
+            # An older release: one county is missing, the other smaller
+            del response['data']['05000US02016']
+            del response['geography']['05000US02016']
+            response['geography']['05000US02013']['name'] = 'Old name'
+            response['data']['05000US02013']['B25003']['estimate'].update(
+                B25003002=500.0, B25003003=300.0
+            )
+        body = json.dumps(response).encode('utf-8')
+        return contextlib.nullcontext(FakeResponse(body))
+
+    def test_panel(self):
+        with mock.patch.object(ACS2016, '_http_open',
+                               side_effect=self.http_open) as http_open:
+            result = ACS2016.get_dataframe_panel(
+                'ownership_of_occupied_units', '050|04000US02',
+                ['acs2016_5yr', 'acs2017_5yr'], include_moe=True
+            )
+        self.assertEqual(http_open.call_count, 2)
+        self.assertEqual(list(result.columns[:6]), [
+            'release', 'name', 'geoid', 'Owner Occupied',
+            'Owner Occupied_moe', 'Renter Occupied',
+        ])
+        self.assertEqual(list(result['release']),
+                         ['acs2016_5yr', 'acs2017_5yr'] * 2)
+        self.assertEqual(list(result['geoid']),
+                         ['05000US02013', '05000US02013',
+                          '05000US02016', '05000US02016'])
+        self.assertEqual(list(result['name'][:2]),
+                         ['Aleutians East Borough, AK'] * 2)
+        np.testing.assert_array_equal(result['Owner Occupied'],
+                                      [500.0, 600.0, np.nan, 500.0])
+        np.testing.assert_array_equal(result['Owner Occupied_change'],
+                                      [np.nan, 100.0, np.nan, np.nan])
+        self.assertEqual(result['Owner Occupied_change_moe'][1],
+                         (40 ** 2 + 40 ** 2) ** 0.5)
+
+    def test_extending_panel_fetches_only_new_release(self):
+        with mock.patch.object(ACS2016, '_http_open',
+                               side_effect=self.http_open) as http_open:
+            ACS2016.get_dataframe_panel('ownership_of_occupied_units',
+                                        '050|04000US02', ['acs2016_5yr'])
+            ACS2016.get_dataframe_panel('ownership_of_occupied_units',
+                                        '050|04000US02',
+                                        ['acs2016_5yr', 'acs2017_5yr'])
+        self.assertEqual(http_open.call_count, 2)
+
+
+class BulkFetchTest(CachedTestCase):
+    def test_long_geoid_list_split_across_requests(self):
+        geoids = ['05000US02013', '05000US02016', '05000US02020']
+
+        def http_open(url, headers={}):
+            geoid = url.split('geo_ids=')[1]
+            response = json.loads(json.dumps(RESPONSE))
+            response['data'] = {geoid: RESPONSE['data']['05000US02013']}
+            response['geography'] = {geoid: {'name': geoid}}
+            body = json.dumps(response).encode('utf-8')
+            return contextlib.nullcontext(FakeResponse(body))
+
+        with mock.patch.object(ACS2016, 'MAX_GEOIDS_PER_REQUEST', 1):
+            with mock.patch.object(ACS2016, '_http_open',
+                                   side_effect=http_open) as http_open:
+                result = get_data('B25003', geoids)
+        self.assertEqual(http_open.call_count, 3)
+        self.assertEqual(sorted(result['data']), geoids)
+        self.assertEqual(list(result['geography']), geoids)
+
+    def test_render_all_states(self):
+        with mock_http_open() as http_open:
+            result = render(None, {'topic': 'ownership_of_occupied_units',
+                                   'sumlevel': 'metro_areas',
+                                   'statecode': 'all'})
+        self.assertEqual(http_open.call_count, len(ACS2016.STATE_FIPS))
+        self.assertIn('geo_ids=310%7C04000US78', ''.join(
+            call[0][0] for call in http_open.call_args_list
+        ))
+        # every state's response held the same two metros
+        self.assertEqual(list(result['geoid']),
+                         ['05000US02013', '05000US02016'])
+        self.assertEqual(list(result.index), [0, 1])
+
+
+class CoalesceTest(CachedTestCase):
+    def run_concurrently(self, fn, n=4):
+        """Call fn() from `n` threads while the first download is stalled."""
+        body = json.dumps(RESPONSE).encode('utf-8')
+        started = threading.Event()
+
+        def http_open(url, headers={}):
+            started.set()
+            time.sleep(0.2)  # long enough for the other threads to queue
+            return contextlib.nullcontext(FakeResponse(body))
+
+        results = [None] * n
+
+        def run(i):
+            results[i] = fn()
+
+        with mock.patch.object(ACS2016, '_http_open',
+                               side_effect=http_open) as mock_open:
+            threads = [threading.Thread(target=run, args=(i,))
+                       for i in range(n)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertTrue(started.is_set())
+        return mock_open.call_count, results
+
+    def test_get_data_downloads_once(self):
+        call_count, results = self.run_concurrently(
+            lambda: get_data('B25003', '050|04000US02')
+        )
+        self.assertEqual(call_count, 1)
+        for result in results:
+            self.assertEqual(result['data'], RESPONSE['data'])
+        # the lock file is gone once the download is cached
+        self.assertEqual(len(os.listdir(self.tempdir.name)), 1)
+
+    def test_get_dataframe_simple_shares_result(self):
+        call_count, results = self.run_concurrently(
+            lambda: get_dataframe_simple('ownership_of_occupied_units',
+                                         '050|04000US02')
+        )
+        self.assertEqual(call_count, 1)
+        for result in results[1:]:
+            assert_frame_equal(result, results[0])
+            self.assertIsNot(result, results[0])  # callers may mutate theirs
+
+    @unittest.skipIf(ACS2016.fcntl is None, 'no flock() on this platform')
+    def test_processes_download_once(self):
+        # Threads queue on a threading.Lock first; processes meet at flock()
+        downloads = os.path.join(self.tempdir.name, 'downloads')
+        cache_dir = os.path.join(self.tempdir.name, 'cache')
+        body_path = os.path.join(self.tempdir.name, 'body.json')
+        with open(body_path, 'w') as f:
+            json.dump(RESPONSE, f)
+        script = ('import contextlib, io, json, sys, time, ACS2016\n'
+                  'ACS2016.CACHE_DIR = sys.argv[1]\n'
+                  'with open(sys.argv[3], "rb") as f:\n'
+                  '    body = f.read()\n'
+                  'class Response(io.BytesIO):\n'
+                  '    status = 200\n'
+                  '    def getheader(self, name, default=None):\n'
+                  '        return default\n'
+                  '@contextlib.contextmanager\n'
+                  'def http_open(url, headers=None):\n'
+                  '    with open(sys.argv[2], "a") as f:\n'
+                  '        f.write("x")\n'
+                  '    time.sleep(1)  # long enough for the other to queue\n'
+                  '    yield Response(body)\n'
+                  'ACS2016._http_open = http_open\n'
+                  'print(ACS2016.get_data("B25003", "050|04000US02")\n'
+                  '      == json.loads(body))\n')
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-c', script, cache_dir, downloads,
+                 body_path],
+                stdout=subprocess.PIPE,
+                cwd=os.path.dirname(os.path.abspath(ACS2016.__file__))
+            )
+            for _ in range(2)
+        ]
+        outputs = [process.communicate()[0] for process in processes]
+        self.assertEqual(outputs, [b'True\n', b'True\n'])
+        with open(downloads) as f:
+            self.assertEqual(f.read(), 'x')
+        # the lock file is gone once the download is cached
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_callers_mutating_results(self):
+        def fetch_and_mutate():
+            frame = get_dataframe_simple('ownership_of_occupied_units',
+                                         '050|04000US02')
+            frame.insert(0, 'release', 'latest')  # like get_dataframe_panel()
+            frame['Owner Occupied'] *= 2
+            return frame
+
+        call_count, results = self.run_concurrently(fetch_and_mutate)
+        self.assertEqual(call_count, 1)
+        for result in results:
+            self.assertEqual(list(result['Owner Occupied']), [1200.0, 1000.0])
+
 
 if __name__ == "__main__":
     unittest.main()